@@ -0,0 +1,67 @@
+"""
+Tests reading a cached job while the cache has heavy tailed latency, and
+that slow reads are hedged. Reads ask for a byte range, so that they reach
+the cache instead of being served from the result buffer. Start the stack
+with noise, e.g.:
+    RETRIEVAL_NOISE=4 docker compose up
+"""
+import time
+import asyncio
+import string
+import statistics
+import aiohttp
+
+import util
+import settings
+from itg_test_job import job_url, msg
+
+async def timed_request(url, headers = None):
+    started = time.time()
+    async with aiohttp.ClientSession() as session:
+        async with session.get(url, headers = headers) as response:
+            await response.read()
+            return response.status, time.time() - started
+
+async def test():
+    await util.clear_cache()
+    steps = list(string.ascii_lowercase[:2])
+    url = job_url(steps)
+
+    print(msg("Computing job"))
+    status = None
+    while status != 200:
+        status, _ = await timed_request(url)
+        await asyncio.sleep(1)
+
+    print(msg("Reading job"))
+    results = []
+    for _ in range(10):
+        results += await asyncio.gather(*[timed_request(url, {"Range": "bytes=0-"}) for _ in range(10)])
+
+    latencies = sorted(latency for status, latency in results if status in (200, 206))
+    statuses = {status for status, _ in results}
+    print(f"Statuses: {statuses}")
+    print(f"Latency p50: {statistics.median(latencies):.2f} p95: {latencies[int(.95 * len(latencies))]:.2f} max: {latencies[-1]:.2f}")
+
+    async with aiohttp.ClientSession() as session:
+        async with session.get(settings.JOB_MANAGER_URL + "/stats/cache") as response:
+            stats = await response.json()
+    print(f"Cache reads: {stats}")
+    hedged = stats["operations"].get("get", {}).get("hedged", 0)
+
+    try:
+        assert statuses <= {200, 206, 503}
+    except AssertionError:
+        print(f"Got bad http codes: {statuses}")
+    else:
+        print("Only got good responses!")
+
+    try:
+        assert hedged > 0
+    except AssertionError:
+        print("ERROR: No reads were hedged")
+    else:
+        print(f"Hedged {hedged} reads, as expected.")
+
+if __name__ == "__main__":
+    asyncio.run(test())
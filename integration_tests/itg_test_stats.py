@@ -0,0 +1,43 @@
+"""
+Tests that the durations and sizes of computed jobs are recorded in Redis,
+by the script that RedisLocks.record_task runs there.
+"""
+import string
+import asyncio
+import aiohttp
+
+import util
+import settings
+from itg_test_job import job_url, msg
+
+async def test():
+    await util.clear_cache()
+    steps = list(string.ascii_lowercase[:3])
+
+    async with aiohttp.ClientSession() as session:
+        async with session.get(settings.JOB_MANAGER_URL + "/stats/") as response:
+            before = (await response.json())["stats"]
+
+        print(msg("Computing job"))
+        status = None
+        while status != 200:
+            async with session.get(job_url(steps)) as response:
+                status = response.status
+            await asyncio.sleep(1)
+
+        async with session.get(settings.JOB_MANAGER_URL + "/stats/") as response:
+            after = (await response.json())["stats"]
+
+    print(f"Task statistics: {after}")
+    counts = {task: s["count"] - before.get(task, {"count": 0})["count"] for task, s in after.items()}
+
+    try:
+        assert sum(counts.values()) >= len(steps)
+        assert all(s["mean_duration"] > 0 and s["mean_size"] > 0 for s in after.values())
+    except AssertionError:
+        print(f"ERROR: Expected {len(steps)} new observations, got {counts}")
+    else:
+        print(f"Recorded {sum(counts.values())} observations, as expected.")
+
+if __name__ == "__main__":
+    asyncio.run(test())
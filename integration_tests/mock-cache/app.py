@@ -44,9 +44,23 @@ RETRIEVAL_TIME = int(os.getenv("RETRIEVAL_TIME", "1"))
 RETRIEVAL_NOISE = int(os.getenv("RETRIEVAL_NOISE", "0"))
 CACHE = Cache()
 
+STATE = {
+    "reads": 0,
+    "writes": 0,
+    }
+
 async def with_sleep_time():
     return RETRIEVAL_TIME - (RETRIEVAL_NOISE / 2) + (random.random() * RETRIEVAL_NOISE)
 
+@app.delete("/requests/")
+def clear_n_requests():
+    for k in STATE:
+        STATE[k] = 0
+
+@app.get("/requests/")
+def show_n_requests():
+    return STATE
+
 @app.get("/clear/")
 def clear_cache():
     for k in [*CACHE.keys()]:
@@ -60,6 +74,7 @@ async def list_all(sleep_time = Depends(with_sleep_time)):
 
 @app.get("/files/{path:path}")
 async def get_something(path: str, sleep_time = Depends(with_sleep_time)):
+    STATE["reads"] += 1
     try:
         content = CACHE[path]
         await asyncio.sleep(sleep_time)
@@ -69,6 +84,7 @@ async def get_something(path: str, sleep_time = Depends(with_sleep_time)):
 
 @app.post("/files/{path:path}")
 async def post_something(path: str, file: UploadFile = File(None)):
+    STATE["writes"] += 1
     if file is None:
         return Response(status_code = 400)
     else:
@@ -0,0 +1,153 @@
+"""
+Replays a recorded request trace (see TRACE_PATH) against a job manager, and
+reports response latencies and the calls made to the mock source and cache.
+
+Examples:
+    python replay.py trace.jsonl                  # at the recorded pace
+    python replay.py trace.jsonl --speed 10       # ten times faster
+    python replay.py trace.jsonl --speed 0        # as fast as possible
+"""
+from typing import Any, Dict, List, Tuple
+import sys
+import json
+import time
+import asyncio
+import argparse
+from collections import defaultdict
+import aiohttp
+
+import util
+import settings
+
+def read_trace(path: str, include_forwarded: bool = False)-> List[Dict[str, Any]]:
+    entries = []
+    with open(path) as f:
+        for line in f:
+            try:
+                entry = json.loads(line)
+                entry["ts"] = float(entry["ts"])
+                entry["path"] = entry["path"].strip("/")
+            except (ValueError, KeyError, TypeError, AttributeError):
+                continue
+            if not entry["path"]:
+                continue
+            # Forwarded and redirected requests are also in the trace of the node they came in at
+            if entry.get("forwarded") and not include_forwarded:
+                continue
+            entries.append(entry)
+    return sorted(entries, key = lambda e: e["ts"])
+
+def percentile(values: List[float], q: float)-> float:
+    values = sorted(values)
+    return values[min(len(values) - 1, int(q * len(values)))]
+
+def summarize(results: List[Tuple[int, float]])-> Dict[str, Dict[str, float]]:
+    by_status = defaultdict(list)
+    for status, latency in results:
+        by_status[str(status)].append(latency)
+    return {status: {
+                "count": len(latencies),
+                "p50": percentile(latencies, .5),
+                "p95": percentile(latencies, .95),
+                "p99": percentile(latencies, .99),
+                "max": max(latencies),
+            } for status, latencies in sorted(by_status.items())}
+
+async def upstream_counts(session: aiohttp.ClientSession)-> Dict[str, int]:
+    async with session.get(settings.SOURCE_URL + "/requests/") as response:
+        source = await response.json()
+    async with session.get(settings.CACHE_URL + "/requests/") as response:
+        cache = await response.json()
+    return {
+            "source_requests": source["number_of_requests"],
+            "cache_reads": cache["reads"],
+            "cache_writes": cache["writes"],
+        }
+
+async def replay(
+        entries: List[Dict[str, Any]],
+        manager_url: str,
+        speed: float,
+        concurrency: int,
+        timeout: float,
+        )-> List[Tuple[int, float]]:
+    """
+    Send the requests of a trace, keeping their relative timing divided by
+    speed (or as fast as possible if speed is 0), and return the status and
+    latency of each. Requests that fail or time out are reported with status 0.
+    """
+    slots = asyncio.Semaphore(concurrency)
+    started = time.monotonic()
+    first = entries[0]["ts"] if entries else 0
+
+    async def request(session: aiohttp.ClientSession, entry: Dict[str, Any])-> Tuple[int, float]:
+        if speed > 0:
+            await asyncio.sleep(max(0, (entry["ts"] - first) / speed - (time.monotonic() - started)))
+        async with slots:
+            sent = time.monotonic()
+            try:
+                async with session.get(f"{manager_url}/job/{entry['path']}", allow_redirects = True) as response:
+                    await response.read()
+                    return response.status, time.monotonic() - sent
+            except (aiohttp.ClientError, asyncio.TimeoutError):
+                return 0, time.monotonic() - sent
+
+    async with aiohttp.ClientSession(timeout = aiohttp.ClientTimeout(total = timeout)) as session:
+        return await asyncio.gather(*[request(session, e) for e in entries])
+
+def print_summary(title: str, summary: Dict[str, Dict[str, float]])-> None:
+    print(title)
+    print(f"  {'status':>6} {'count':>7} {'p50':>8} {'p95':>8} {'p99':>8} {'max':>8}")
+    for status, s in summary.items():
+        print(f"  {status:>6} {s['count']:>7} {s['p50']:>8.3f} {s['p95']:>8.3f} {s['p99']:>8.3f} {s['max']:>8.3f}")
+
+async def main(argv = None)-> int:
+    parser = argparse.ArgumentParser(description = __doc__, formatter_class = argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("trace", help = "JSONL trace, as recorded to TRACE_PATH")
+    parser.add_argument("--speed", type = float, default = 1, help = "Factor to speed up the recorded pace by, 0 for as fast as possible")
+    parser.add_argument("--concurrency", type = int, default = 100, help = "Maximum requests in flight")
+    parser.add_argument("--timeout", type = float, default = 60, help = "Seconds before a request counts as failed")
+    parser.add_argument("--limit", type = int, default = None, help = "Replay only the first requests of the trace")
+    parser.add_argument("--manager-url", default = settings.JOB_MANAGER_URL)
+    parser.add_argument("--include-forwarded", action = "store_true", help = "Also replay requests that were forwarded between nodes")
+    parser.add_argument("--clear-cache", action = "store_true", help = "Empty the mock cache before replaying")
+    parser.add_argument("--json", action = "store_true", help = "Print the report as JSON")
+    args = parser.parse_args(argv)
+
+    entries = read_trace(args.trace, args.include_forwarded)[:args.limit]
+    if not entries:
+        print("No requests in trace", file = sys.stderr)
+        return 1
+
+    if args.clear_cache:
+        await util.clear_cache()
+
+    async with aiohttp.ClientSession() as session:
+        before = await upstream_counts(session)
+        started = time.monotonic()
+        results = await replay(entries, args.manager_url, args.speed, args.concurrency, args.timeout)
+        duration = time.monotonic() - started
+        after = await upstream_counts(session)
+
+    recorded = [(e["status"], e["latency"]) for e in entries if "status" in e and "latency" in e]
+    report = {
+            "requests": len(entries),
+            "duration": duration,
+            "recorded_duration": entries[-1]["ts"] - entries[0]["ts"],
+            "replayed": summarize(results),
+            "recorded": summarize(recorded) if recorded else None,
+            "upstream": {k: after[k] - before[k] for k in after},
+        }
+
+    if args.json:
+        print(json.dumps(report, indent = 2))
+    else:
+        print(f"Replayed {report['requests']} requests in {duration:.1f}s (recorded over {report['recorded_duration']:.1f}s)")
+        print_summary("Replayed latencies (s):", report["replayed"])
+        if report["recorded"]:
+            print_summary("Recorded latencies (s):", report["recorded"])
+        print("Upstream calls: " + ", ".join(f"{k}: {v}" for k, v in report["upstream"].items()))
+    return 0
+
+if __name__ == "__main__":
+    sys.exit(asyncio.run(main()))
@@ -0,0 +1,162 @@
+import os
+import json
+import time
+import queue
+import logging
+import threading
+from typing import Any, BinaryIO, Deque, Dict, Iterator, List, Optional, Tuple
+from collections import defaultdict, deque
+from . import parse
+
+logger = logging.getLogger(__name__)
+
+class AccessLog():
+    """
+    AccessLog
+    =========
+
+    parameters:
+        path (str):       File to append entries to
+        max_bytes (int):  Size after which the file is moved to path.1, replacing the previous one
+
+    Appends entries to a JSONL file, one object per line. Entries are written
+    by a background thread, so that logging never blocks the event loop.
+    Several processes can share a log: each one reopens the file when another
+    has rotated it.
+    """
+    def __init__(self, path: str, max_bytes: int = 100 * 2**20):
+        self._path = path
+        self._max_bytes = max_bytes
+        self._queue: "queue.SimpleQueue[Optional[Dict[str, Any]]]" = queue.SimpleQueue()
+        self._thread: Optional[threading.Thread] = None
+
+    def write(self, entry: Dict[str, Any])-> None:
+        if self._thread is None:
+            self._thread = threading.Thread(target = self._run, name = "access-log", daemon = True)
+            self._thread.start()
+        self._queue.put(entry)
+
+    def close(self)-> None:
+        """
+        Write the remaining entries and close the file
+        """
+        if self._thread is not None:
+            self._queue.put(None)
+            self._thread.join()
+            self._thread = None
+
+    def _run(self)-> None:
+        file: Optional[BinaryIO] = None
+        try:
+            while (entry := self._queue.get()) is not None:
+                try:
+                    if file is None or self._rotated(file):
+                        if file is not None:
+                            file.close()
+                        file = open(self._path, "ab")
+
+                    file.write((json.dumps(entry) + "\n").encode())
+                    if self._queue.empty():
+                        file.flush()
+                    if file.tell() >= self._max_bytes:
+                        file.flush()
+                        self._rotate()
+                except OSError as e:
+                    logger.error(f"Failed to write to {self._path}: {e}")
+        finally:
+            if file is not None:
+                file.close()
+
+    def _rotated(self, file: BinaryIO)-> bool:
+        try:
+            return os.stat(self._path).st_ino != os.fstat(file.fileno()).st_ino
+        except FileNotFoundError:
+            return True
+
+    def _rotate(self)-> None:
+        try:
+            os.replace(self._path, self._path + ".1")
+        except FileNotFoundError:
+            # Rotated by another process in the meantime
+            pass
+
+def read(path: str, since: float = 0)-> Iterator[Dict[str, Any]]:
+    """
+    Yields the entries of a JSONL access log, and of its rotated part, with a
+    timestamp (ts) after since, skipping lines that cannot be parsed
+    """
+    for part in (path + ".1", path):
+        try:
+            with open(part) as f:
+                for line in f:
+                    try:
+                        entry = json.loads(line)
+                        if float(entry["ts"]) >= since:
+                            yield entry
+                    except (ValueError, KeyError, TypeError):
+                        logger.debug(f"Skipping malformed access log line: {line!r}")
+        except FileNotFoundError:
+            continue
+
+class History():
+    """
+    History
+    =======
+
+    parameters:
+        half_life (float):         Seconds after which a request counts half as much
+        successor_window (float):  Seconds after a request in which extensions of it count as its successors
+
+    Learns which chains are requested often (with recent requests weighing
+    more), and which longer chains tend to be requested after a chain they
+    extend.
+    """
+    def __init__(self, half_life: float = 30 * 86400, successor_window: float = 3600):
+        self._half_life = half_life
+        self._successor_window = successor_window
+
+        self.scores: Dict[str, float] = defaultdict(float)
+        self.successors: Dict[str, Dict[str, int]] = defaultdict(lambda: defaultdict(int))
+
+    def learn(self, entries: List[Dict[str, Any]], now: Optional[float] = None)-> "History":
+        now = now if now is not None else time.time()
+        requests: List[Tuple[float, str]] = sorted((float(e["ts"]), e["path"]) for e in entries)
+        # Requests within the successor window of the current one, oldest first, and how often each path occurs there
+        recent: Deque[Tuple[float, str]] = deque()
+        in_window: Dict[str, int] = defaultdict(int)
+
+        for ts, path in requests:
+            self.scores[path] += .5 ** (max(0.0, now - ts) / self._half_life)
+
+            try:
+                subjobs = set(parse.subjobs(path))
+            except parse.ParsingError:
+                continue
+
+            while recent and ts - recent[0][0] > self._successor_window:
+                _, expired = recent.popleft()
+                in_window[expired] -= 1
+                if in_window[expired] == 0:
+                    del in_window[expired]
+
+            for earlier in subjobs:
+                if earlier != path and earlier in in_window:
+                    self.successors[earlier][path] += 1
+            recent.append((ts, path))
+            in_window[path] += 1
+
+        return self
+
+    def frequent(self, min_score: float, limit: Optional[int] = None)-> List[str]:
+        """
+        Returns chains scoring at least min_score, most frequent first
+        """
+        chains = sorted((c for c, s in self.scores.items() if s >= min_score), key = lambda c: -self.scores[c])
+        return chains[:limit]
+
+    def successors_of(self, path: str, min_count: int)-> List[str]:
+        """
+        Returns chains that followed a chain at least min_count times, most common first
+        """
+        followers = self.successors.get(path, {})
+        return sorted((f for f, n in followers.items() if n >= min_count), key = lambda f: -followers[f])
@@ -1,8 +1,15 @@
 
-from typing import List
+from typing import List, Tuple, Optional
 import logging
-from fastapi import Depends, Response, FastAPI, BackgroundTasks
-from . import settings, parse, remotes, caching, job_handler, redis_locks
+import math
+import time
+import secrets
+import asyncio
+import random
+from urllib.parse import urlencode
+from fastapi import Depends, Response, FastAPI, Header, HTTPException, Request, Query
+from fastapi.responses import JSONResponse, RedirectResponse
+from . import settings, parse, remotes, caching, job_handler, redis_locks, lifecycle, stats, diagnostics, routing, access_history, prefetch, result_buffer, hedging
 
 logging.basicConfig(level = getattr(logging, settings.LOG_LEVEL))
 logger = logging.getLogger(__name__)
@@ -11,9 +18,29 @@ redis_logger.setLevel(logging.WARNING)
 
 app = FastAPI()
 
+worker = lifecycle.Worker(settings.WORKER_ID, settings.DRAIN_TIMEOUT, settings.HEARTBEAT_INTERVAL)
+membership = routing.Membership(settings.NODE_URL, settings.ROUTING_REFRESH_INTERVAL)
+loop_monitor = diagnostics.LoopMonitor(settings.LOOP_MONITOR_INTERVAL, settings.SLOW_CALLBACK_THRESHOLD)
+results = result_buffer.ResultBuffer(settings.RESULT_BUFFER_BYTES, settings.RESULT_BUFFER_TTL)
+access_log = access_history.AccessLog(settings.ACCESS_LOG_PATH, settings.ACCESS_LOG_MAX_BYTES) if settings.ACCESS_LOG_PATH else None
+trace_log = access_history.AccessLog(settings.TRACE_PATH, settings.ACCESS_LOG_MAX_BYTES) if settings.TRACE_PATH else None
+
+cache_guard = hedging.Guard(
+        {"get": settings.CACHE_GET_DEADLINE, "head": settings.CACHE_HEAD_DEADLINE},
+        settings.CACHE_HEDGE_QUANTILE,
+        breaker = hedging.CircuitBreaker(settings.CACHE_BREAKER_THRESHOLD, settings.CACHE_BREAKER_COOLDOWN))
+
 get_api = lambda: remotes.Api(settings.ROUTER_URL)
-get_cache = lambda: caching.RESTCache(settings.DATA_CACHE_URL+"/files")
-get_locks = lambda: redis_locks.RedisLocks(settings.REDIS_HOST, settings.REDIS_PORT, settings.REDIS_DB, settings.REDIS_ERROR_KEY_PREFIX, settings.REDIS_JOB_KEY_PREFIX)
+get_cache = lambda: caching.RESTCache(settings.DATA_CACHE_URL+"/files", cache_guard, settings.CACHE_SET_TIMEOUT)
+get_locks = lambda: redis_locks.RedisLocks(settings.REDIS_HOST, settings.REDIS_PORT, settings.REDIS_DB, settings.REDIS_ERROR_KEY_PREFIX, settings.REDIS_JOB_KEY_PREFIX,
+        settings.REDIS_JOURNAL_KEY, settings.REDIS_WORKER_KEY_PREFIX, settings.WORKER_ID, settings.REDIS_STATS_KEY,
+        settings.REDIS_ETAG_KEY_PREFIX, settings.REDIS_INTEREST_KEY_PREFIX, settings.REDIS_CLUSTER,
+        settings.REDIS_NODE_KEY_PREFIX)
+
+warmer = prefetch.Warmer(worker, settings.ACCESS_LOG_PATH, lambda jobs: warm_jobs(jobs), get_cache,
+        idle_after = settings.PREFETCH_IDLE_AFTER,
+        half_life = settings.PREFETCH_HALF_LIFE,
+        min_score = settings.PREFETCH_MIN_SCORE) if settings.PREFETCH_ENABLED and settings.ACCESS_LOG_PATH else None
 
 def with_rest_cache():
     try:
@@ -22,6 +49,10 @@ def with_rest_cache():
     finally:
         pass
 
+def with_debug_token(x_debug_token: Optional[str] = Header(None)):
+    if settings.DEBUG_TOKEN is None or not secrets.compare_digest(x_debug_token or "", settings.DEBUG_TOKEN):
+        raise HTTPException(status_code = 404)
+
 async def with_locks_client():
     try:
         client = get_locks()
@@ -29,16 +60,105 @@ async def with_locks_client():
     finally:
         await client.close()
 
-async def dispatch_jobs(jobs: List[str]):
-    try:
-        api, cache, locks = get_api() ,get_cache(), get_locks()
-        handler = job_handler.JobHandler(api, cache, locks,
-                    settings.RETRY_SLEEP, settings.MAX_RETRIES, settings.CHECK_ERRORS_EVERY)
+async def estimate_remaining(
+        jobs: List[str],
+        locks_client: redis_locks.RedisLocks,
+        cache_client: caching.RESTCache) -> Tuple[float, List[str]]:
+    """
+    Returns the expected time until the final job is done, along with the jobs
+    that remain, which are the ones after the deepest cached job. The cache is
+    checked for all prerequisites at once.
+    """
+    async def is_cached(job: str)-> bool:
+        try:
+            return await cache_client.exists(job)
+        except caching.CacheUnavailable:
+            return True
 
-        await handler.handle_jobs(jobs)
-    finally:
-        await locks.cleanup()
-        await locks.close()
+    cached = await asyncio.gather(*[is_cached(job) for job in jobs[:-1]])
+    remaining = jobs[-1:]
+    for job, is_cached_job in zip(jobs[-2::-1], cached[::-1]):
+        if is_cached_job:
+            break
+        remaining.insert(0, job)
+
+    task_stats = await locks_client.task_stats([stats.job_task_key(job) for job in remaining])
+    return stats.eta(remaining, task_stats, settings.DEFAULT_TASK_DURATION), remaining
+
+async def current_etag(
+        job: str,
+        locks_client: redis_locks.RedisLocks,
+        cache_client: caching.RESTCache) -> Optional[str]:
+    """
+    Returns the stored ETag of a cached job, if any. ETags are computed from
+    the content, so that results served from the result buffer and from the
+    cache share them. Raises caching.NotCached if the job is not cached.
+    """
+    etag = await locks_client.get_etag(job)
+    if etag is not None and not await cache_client.exists(job):
+        raise caching.NotCached
+    return etag
+
+async def dispatch_jobs(jobs: List[str], requested: bool = True):
+    """
+    Handles a chain of jobs. Chains that were not requested by a client, such
+    as recovered and warmed ones, are never given up for lack of interest,
+    since no client polls for them.
+    """
+    handler = job_handler.JobHandler(get_api(), get_cache(), get_locks(),
+                settings.RETRY_SLEEP, settings.MAX_RETRIES, settings.CHECK_ERRORS_EVERY,
+                settings.PIPELINE_UPLOADS, settings.MAX_INFLIGHT_UPLOADS, settings.STATS_SMOOTHING,
+                settings.CANCEL_ABANDONED and requested, results)
+    await handler.handle_chain(jobs)
+
+async def warm_jobs(jobs: List[str]):
+    await dispatch_jobs(jobs, requested = False)
+
+async def record_trace(request: Request, call_next):
+    """
+    Records a sample of job requests, with their outcome and latency, to the
+    trace file.
+    """
+    path = request.url.path[len("/job/"):]
+    if not request.url.path.startswith("/job/") or not path or random.random() >= settings.TRACE_SAMPLE_RATE:
+        return await call_next(request)
+
+    started_at, started = time.time(), time.perf_counter()
+    response = await call_next(request)
+    trace_log.write({
+            "ts": started_at,
+            "path": path,
+            "status": response.status_code,
+            "latency": time.perf_counter() - started,
+            "forwarded": routing.FORWARDED_HEADER in request.headers or routing.REDIRECTED_PARAM in request.query_params,
+        })
+    return response
+
+# The middleware wraps every response, so it is only installed when tracing
+if trace_log is not None:
+    app.middleware("http")(record_trace)
+
+@app.on_event("startup")
+async def start_worker():
+    loop_monitor.start()
+    await worker.start(get_locks, lambda jobs: dispatch_jobs(jobs, requested = False))
+    if settings.ROUTING_ENABLED:
+        membership.start(get_locks)
+    if warmer is not None:
+        warmer.start()
+
+@app.on_event("shutdown")
+async def drain_worker():
+    if warmer is not None:
+        warmer.stop()
+    if settings.ROUTING_ENABLED:
+        await membership.leave(get_locks)
+    await worker.drain(get_locks)
+    loop_monitor.stop()
+    if access_log is not None:
+        access_log.close()
+    if trace_log is not None:
+        trace_log.close()
 
 @app.get("/job/")
 async def list_jobs(locks: redis_locks.RedisLocks = Depends(with_locks_client)):
@@ -47,16 +167,47 @@ async def list_jobs(locks: redis_locks.RedisLocks = Depends(with_locks_client)):
 
 @app.get("/job/{path:path}")
 async def get_job(
+        request: Request,
         path: str,
-        background_tasks: BackgroundTasks,
+        if_none_match: Optional[str] = Header(None),
+        byte_range: Optional[str] = Header(None, alias = "Range"),
+        x_jobman_forwarded: Optional[str] = Header(None),
+        redirected: Optional[str] = Query(None, alias = routing.REDIRECTED_PARAM),
         locks_client: redis_locks.RedisLocks = Depends(with_locks_client),
         cache_client: caching.RESTCache = Depends(with_rest_cache)):
 
+    if worker.draining:
+        return Response("Shutting down", status_code = 503, headers = {"Retry-After": str(settings.RETRY_SLEEP)})
+
     try:
         requested_jobs = parse.subjobs(path)
     except parse.ParsingError:
         return Response(content = f"Could not parse as job path: {path}", status_code = 404)
 
+    # Requests that were already forwarded or redirected are served here, even
+    # if this node's view of the ring differs from that of the sender
+    if settings.ROUTING_ENABLED and x_jobman_forwarded is None and redirected is None:
+        owner = membership.owner(parse.chain_tag(path))
+        if owner != membership.node_url:
+            params = request.query_params.multi_items()
+            if settings.ROUTING_MODE == "redirect":
+                query = urlencode([*params, (routing.REDIRECTED_PARAM, "1")])
+                return RedirectResponse(f"{owner}/job/{path}?{query}", status_code = 307)
+
+            headers = {k: v for k,v in {"If-None-Match": if_none_match, "Range": byte_range}.items() if v is not None}
+            try:
+                status, content, headers = await routing.forward(owner, path, headers, settings.FORWARD_TIMEOUT, params)
+            except routing.NodeUnavailable as e:
+                logger.warning(str(e))
+                membership.mark_dead(owner)
+            else:
+                return Response(content, status_code = status, headers = headers)
+
+    if access_log is not None:
+        access_log.write({"ts": time.time(), "path": path})
+    if warmer is not None:
+        warmer.notice_request(path)
+
     for job in requested_jobs:
         try:
             error = await locks_client.retry_error(job, settings.MAX_TIMEOUT_RETRIES, settings.TIMEOUT_COOLDOWN)
@@ -64,16 +215,66 @@ async def get_job(
         except AssertionError:
             return Response(f"{job} returned {error}", status_code = error.http_status_code)
 
+    if byte_range is None and (buffered := results.get(requested_jobs[-1])) is not None:
+        content, etag = buffered
+        if caching.etag_matches(if_none_match, etag):
+            return Response(status_code = 304, headers = {"ETag": etag})
+        return Response(content, headers = {"ETag": etag})
+
     try:
-        content = await cache_client.get(requested_jobs[-1])
+        if if_none_match is not None:
+            etag = await current_etag(requested_jobs[-1], locks_client, cache_client)
+            if caching.etag_matches(if_none_match, etag):
+                return Response(status_code = 304, headers = {"ETag": etag})
+
+        cached = await cache_client.fetch(requested_jobs[-1], byte_range)
     except caching.NotCached:
         pass
+    except caching.CacheUnavailable as e:
+        logger.error(str(e))
+        return Response("Data cache unavailable", status_code = 503,
+                headers = {"Retry-After": str(math.ceil(cache_guard.breaker.cooldown))})
     else:
-        return Response(content)
+        etag = await locks_client.get_etag(requested_jobs[-1])
+        if etag is None and cached.status == 200:
+            etag = caching.content_etag(cached.content)
+            await locks_client.set_etag(requested_jobs[-1], etag)
+
+        headers = {}
+        if etag is not None:
+            headers["ETag"] = etag
+        if cached.content_range is not None:
+            headers["Content-Range"] = cached.content_range
+        return Response(cached.content, status_code = cached.status, headers = headers)
+
+    try:
+        worker.dispatch(dispatch_jobs(requested_jobs))
+    except lifecycle.Draining:
+        return Response("Shutting down", status_code = 503, headers = {"Retry-After": str(settings.RETRY_SLEEP)})
 
-    background_tasks.add_task(dispatch_jobs, requested_jobs)
+    eta, remaining = await estimate_remaining(requested_jobs, locks_client, cache_client)
+    retry_after = max(1, math.ceil(eta))
 
-    return Response(status_code = 202)
+    # Keep the chain wanted until the client is due to check back
+    await locks_client.register_interest(requested_jobs[-1], settings.INTEREST_WINDOW + retry_after)
+
+    return JSONResponse(
+            {"status": "pending", "eta": eta, "remaining": remaining},
+            status_code = 202,
+            headers = {"Retry-After": str(retry_after)})
+
+@app.get("/stats/")
+async def get_stats(locks_client: redis_locks.RedisLocks = Depends(with_locks_client)):
+    task_stats = await locks_client.task_stats()
+    return {"stats": {k: v.dict() for k,v in task_stats.items()}}
+
+@app.get("/stats/cache")
+async def get_cache_stats():
+    return cache_guard.metrics()
+
+@app.get("/nodes/")
+async def get_nodes():
+    return {"routing": settings.ROUTING_ENABLED, "node": membership.node_url, "nodes": sorted(membership.nodes)}
 
 @app.get("/errors/")
 async def get_errors(locks_client: redis_locks.RedisLocks = Depends(with_locks_client)):
@@ -84,3 +285,19 @@ async def get_errors(locks_client: redis_locks.RedisLocks = Depends(with_locks_c
 async def delete_errors(locks_client: redis_locks.RedisLocks = Depends(with_locks_client)):
     await locks_client.clear_errors()
     return Response(status_code = 204)
+
+@app.get("/debug/loop", dependencies = [Depends(with_debug_token)])
+async def get_loop_lag():
+    return {"worker": settings.WORKER_ID, "lag": loop_monitor.lag()}
+
+@app.get("/debug/profile", dependencies = [Depends(with_debug_token)])
+async def get_profile(seconds: float = 10):
+    seconds = min(seconds, settings.MAX_PROFILE_SECONDS)
+    try:
+        profile = await diagnostics.profile(seconds)
+    except diagnostics.ProfilerBusy:
+        return Response("A profile is already being captured", status_code = 409)
+
+    return Response(profile,
+            media_type = "application/octet-stream",
+            headers = {"Content-Disposition": f"attachment; filename=jobman-{settings.WORKER_ID}.prof"})
@@ -1,21 +1,69 @@
 from io import BytesIO
+from typing import Optional, Callable, Awaitable, TypeVar
+import asyncio
+from dataclasses import dataclass
+import hashlib
 import logging
 import aiohttp
+from . import hedging
 
 logger = logging.getLogger(__name__)
 
+T = TypeVar("T")
+
 class NotCached(Exception):
     pass
 
+class CacheUnavailable(Exception):
+    pass
+
+@dataclass
+class Cached:
+    content: bytes
+    status: int = 200
+    content_range: Optional[str] = None
+
+def content_etag(content: bytes)-> str:
+    """
+    Returns a strong ETag computed from content
+    """
+    return '"' + hashlib.sha1(content).hexdigest() + '"'
+
+def etag_matches(if_none_match: Optional[str], etag: Optional[str])-> bool:
+    """
+    Checks an If-None-Match header against an ETag, using weak comparison
+    """
+    if if_none_match is None or etag is None:
+        return False
+    if if_none_match.strip() == "*":
+        return True
+
+    strip_weak = lambda tag: tag.strip().replace("W/", "", 1)
+    return strip_weak(etag) in {strip_weak(tag) for tag in if_none_match.split(",")}
+
 class RESTCache:
-    def __init__(self, url):
+    """
+    RESTCache
+    =========
+
+    parameters:
+        url (str):             URL of the files endpoint of a restblobs instance
+        guard (hedging.Guard): Applies deadlines, hedging and circuit breaking to reads
+        set_timeout (float):   Seconds an upload may take
+
+    Reads raise CacheUnavailable if a guarded read exceeds its deadline or
+    the cache is considered degraded.
+    """
+    def __init__(self, url, guard: Optional[hedging.Guard] = None, set_timeout: Optional[float] = None):
         self._url = url
+        self._guard = guard
+        self._set_timeout = aiohttp.ClientTimeout(total = set_timeout)
 
     def url(self, path):
         return self._url + "/" + path
 
     async def set(self,key,content):
-        async with aiohttp.ClientSession() as session:
+        async with aiohttp.ClientSession(timeout = self._set_timeout) as session:
             async with session.post(self.url(key), data = {"file": BytesIO(content)}) as resp:
                 text = await resp.text()
                 try:
@@ -24,16 +72,43 @@ class RESTCache:
                     raise ValueError(f"Remote returned {resp.status}: {text} when trying to cache {key}")
 
     async def get(self,key):
-        async with aiohttp.ClientSession() as session:
-            async with session.get(self.url(key)) as resp:
-                try:
-                    assert resp.status != 404
-                except AssertionError:
-                    raise NotCached
-                else:
-                    return await resp.read()
+        return (await self.fetch(key)).content
+
+    async def fetch(self, key: str, byte_range: Optional[str] = None)-> Cached:
+        """
+        Get cached content. If byte_range is passed, it is relayed to the
+        cache as a Range header.
+        """
+        headers = {"Range": byte_range} if byte_range is not None else {}
+
+        async def request():
+            async with aiohttp.ClientSession() as session:
+                async with session.get(self.url(key), headers = headers) as resp:
+                    try:
+                        assert resp.status != 404
+                    except AssertionError:
+                        raise NotCached
+                    else:
+                        return Cached(
+                                content = await resp.read(),
+                                status = resp.status,
+                                content_range = resp.headers.get("Content-Range"))
+
+        return await self._guarded("get", request)
 
     async def exists(self,key: str):
-        async with aiohttp.ClientSession() as session:
-            async with session.head(self.url(key)) as response:
-                return str(response.status)[0] == "2"
+        async def request():
+            async with aiohttp.ClientSession() as session:
+                async with session.head(self.url(key)) as response:
+                    return str(response.status)[0] == "2"
+
+        return await self._guarded("head", request)
+
+    async def _guarded(self, operation: str, request: Callable[[], Awaitable[T]])-> T:
+        if self._guard is None:
+            return await request()
+
+        try:
+            return await self._guard.call(operation, request, expected = (NotCached,))
+        except (hedging.CircuitOpen, asyncio.TimeoutError, aiohttp.ClientError) as e:
+            raise CacheUnavailable(f"Cache {operation} failed: {e!r}") from e
@@ -0,0 +1,119 @@
+import sys
+import time
+import marshal
+import asyncio
+import cProfile
+import logging
+import threading
+import traceback
+from typing import Deque, Dict, Optional
+from collections import deque
+
+logger = logging.getLogger(__name__)
+
+class ProfilerBusy(Exception):
+    pass
+
+class LoopMonitor():
+    """
+    LoopMonitor
+    ===========
+
+    parameters:
+        interval (float):       How often to sample the lag of the event loop, in seconds
+        slow_threshold (float): How long the loop may be blocked before the offending stack is logged
+        window (int):           How many lag samples to keep
+
+    Measures event loop lag as how late a sleeping coroutine wakes up. A
+    watchdog thread pings the loop several times per slow_threshold, and if a
+    ping goes unanswered for slow_threshold, logs what the loop thread is
+    executing at that time, and how long the loop was blocked once it
+    responds again.
+    """
+    def __init__(self, interval: float = .5, slow_threshold: float = .25, window: int = 1000):
+        self._interval = interval
+        self._slow_threshold = slow_threshold
+
+        self._samples: Deque[float] = deque(maxlen = window)
+        self._loop_thread: Optional[int] = None
+
+        self._task: Optional[asyncio.Task] = None
+        self._stopped = threading.Event()
+
+    def start(self)-> None:
+        self._loop_thread = threading.get_ident()
+        self._stopped.clear()
+        self._task = asyncio.create_task(self._sample())
+        threading.Thread(target = self._watch, args = (asyncio.get_running_loop(),), name = "loop-watchdog", daemon = True).start()
+
+    def stop(self)-> None:
+        self._stopped.set()
+        if self._task is not None:
+            self._task.cancel()
+
+    def lag(self)-> Dict[str, Optional[float]]:
+        """
+        Returns percentiles of the sampled loop lag, in seconds
+        """
+        samples = sorted(self._samples)
+        quantile = lambda q: samples[min(len(samples) - 1, int(q * len(samples)))] if samples else None
+        return {
+                "samples": len(samples),
+                "p50": quantile(.5),
+                "p90": quantile(.9),
+                "p99": quantile(.99),
+                "max": samples[-1] if samples else None,
+            }
+
+    async def _sample(self):
+        loop = asyncio.get_running_loop()
+        while True:
+            before = loop.time()
+            await asyncio.sleep(self._interval)
+            self._samples.append(max(0.0, loop.time() - before - self._interval))
+
+    def _watch(self, loop: asyncio.AbstractEventLoop):
+        while not self._stopped.wait(self._slow_threshold / 4):
+            answered = threading.Event()
+            sent = time.monotonic()
+            try:
+                loop.call_soon_threadsafe(answered.set)
+            except RuntimeError:
+                # The loop was closed
+                return
+
+            if answered.wait(self._slow_threshold):
+                continue
+
+            frame = sys._current_frames().get(self._loop_thread)
+            stack = "".join(traceback.format_stack(frame)) if frame is not None else "(unknown)"
+            logger.warning(f"Event loop blocked for more than {self._slow_threshold:.3f}s, currently in:\n{stack}")
+
+            while not answered.wait(self._slow_threshold):
+                if self._stopped.is_set():
+                    return
+            logger.warning(f"Event loop was blocked for {time.monotonic() - sent:.3f}s")
+
+_profiling = threading.Lock()
+
+async def profile(seconds: float)-> bytes:
+    """
+    Profiles the event loop thread for a number of seconds, returning the
+    statistics in the marshalled format read by pstats (and tools such as
+    snakeviz). Only one profile can be captured at a time.
+    """
+    if not _profiling.acquire(blocking = False):
+        raise ProfilerBusy
+
+    try:
+        profiler = cProfile.Profile()
+        profiler.enable()
+        try:
+            await asyncio.sleep(seconds)
+        finally:
+            profiler.disable()
+
+        profiler.create_stats()
+        return marshal.dumps(profiler.stats)
+    finally:
+        _profiling.release()
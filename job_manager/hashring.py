@@ -0,0 +1,34 @@
+import bisect
+import hashlib
+from typing import Iterable, List, Tuple
+
+def _position(key: str)-> int:
+    return int.from_bytes(hashlib.md5(key.encode()).digest()[:8], "big")
+
+class HashRing:
+    """
+    HashRing
+    ========
+
+    parameters:
+        nodes (Iterable[str]): Members of the ring
+        replicas (int):        Number of points per node on the ring
+
+    A consistent hash ring: each key belongs to the first node point following
+    it on the ring, so that adding or removing a node only moves the keys of
+    that node.
+    """
+    def __init__(self, nodes: Iterable[str], replicas: int = 100):
+        self.nodes = frozenset(nodes)
+        self._points: List[Tuple[int, str]] = sorted(
+                (_position(f"{node}#{i}"), node) for node in self.nodes for i in range(replicas))
+        self._positions = [position for position, _ in self._points]
+
+    def node_for(self, key: str)-> str:
+        """
+        Returns the node owning a key. Raises LookupError if the ring is empty.
+        """
+        if not self._points:
+            raise LookupError("No nodes in ring")
+        index = bisect.bisect(self._positions, _position(key)) % len(self._points)
+        return self._points[index][1]
@@ -0,0 +1,218 @@
+import time
+import asyncio
+import logging
+from typing import Awaitable, Callable, Deque, Dict, Optional, Tuple, Type, TypeVar
+from collections import deque
+
+logger = logging.getLogger(__name__)
+
+T = TypeVar("T")
+
+class CircuitOpen(Exception):
+    pass
+
+class LatencyTracker():
+    """
+    Keeps the latest latencies of an operation, to derive quantiles from.
+    """
+    def __init__(self, window: int = 200):
+        self._samples: Deque[float] = deque(maxlen = window)
+
+    def __len__(self):
+        return len(self._samples)
+
+    def record(self, seconds: float)-> None:
+        self._samples.append(seconds)
+
+    def quantile(self, q: float)-> Optional[float]:
+        if not self._samples:
+            return None
+        samples = sorted(self._samples)
+        return samples[min(len(samples) - 1, int(q * len(samples)))]
+
+class CircuitBreaker():
+    """
+    CircuitBreaker
+    ==============
+
+    parameters:
+        failure_threshold (int): Consecutive failures after which the circuit opens
+        cooldown (float):        Seconds the circuit stays open before a trial request is let through
+
+    While open, calls are rejected immediately instead of piling up on a
+    degraded remote.
+    """
+    def __init__(self, failure_threshold: int = 5, cooldown: float = 30):
+        self._failure_threshold = failure_threshold
+        self.cooldown = cooldown
+
+        self._failures = 0
+        self._opened_at: Optional[float] = None
+
+    @property
+    def state(self)-> str:
+        if self._opened_at is None:
+            return "closed"
+        if time.monotonic() - self._opened_at < self.cooldown:
+            return "open"
+        return "half-open"
+
+    def allow(self)-> bool:
+        if self.state == "half-open":
+            # Let one trial through, and hold the rest until it has completed
+            self._opened_at = time.monotonic()
+            return True
+        return self.state == "closed"
+
+    def success(self)-> None:
+        self._failures = 0
+        self._opened_at = None
+
+    def failure(self)-> None:
+        self._failures += 1
+        if self._failures >= self._failure_threshold:
+            if self._opened_at is None:
+                logger.warning(f"Opening circuit after {self._failures} consecutive failures")
+            self._opened_at = time.monotonic()
+
+async def hedged(make_request: Callable[[], Awaitable[T]], delay: Optional[float])-> Tuple[T, bool, bool]:
+    """
+    Runs a request, issuing a second identical one if the first has not
+    completed after delay seconds (never, if delay is None). Returns the first
+    result, whether a hedge was issued and whether the result came from it.
+    If one request fails, the other is awaited before giving up. The request
+    that is left over is cancelled, and has completed when this returns.
+    """
+    first = asyncio.ensure_future(make_request())
+    tasks = {first}
+    try:
+        done, _ = await asyncio.wait(tasks, timeout = delay)
+        if (hedge_issued := not done):
+            tasks.add(asyncio.ensure_future(make_request()))
+
+        error: Optional[BaseException] = None
+        while tasks:
+            done, tasks = await asyncio.wait(tasks, return_when = asyncio.FIRST_COMPLETED)
+            for task in done:
+                if task.exception() is None:
+                    return task.result(), hedge_issued, task is not first
+                error = task.exception()
+        raise error
+    finally:
+        for task in tasks:
+            task.cancel()
+        if tasks:
+            await asyncio.wait(tasks)
+
+class Guard():
+    """
+    Guard
+    =====
+
+    parameters:
+        deadlines (Dict[str, float]): Seconds each operation may take in total
+        hedge_quantile (float):       Quantile of past latencies after which a read is hedged
+        min_hedge_delay (float):      Lower bound of the hedging delay, in seconds
+        min_samples (int):            Latencies to observe before hedging an operation
+        breaker (CircuitBreaker):     Breaker shared by all operations
+
+    Bounds reads against a remote with deadlines, hedges slow ones, and
+    rejects calls while the remote is failing. Keeps counts of what it did.
+    """
+    def __init__(self,
+            deadlines: Dict[str, float],
+            hedge_quantile: float = .95,
+            min_hedge_delay: float = .05,
+            min_samples: int = 20,
+            breaker: Optional[CircuitBreaker] = None):
+
+        self._deadlines = deadlines
+        self._hedge_quantile = hedge_quantile
+        self._min_hedge_delay = min_hedge_delay
+        self._min_samples = min_samples
+        self.breaker = breaker or CircuitBreaker()
+
+        self._latencies: Dict[str, LatencyTracker] = {}
+        self._counts: Dict[str, Dict[str, int]] = {}
+
+    def hedge_delay(self, operation: str)-> Optional[float]:
+        tracker = self._latencies.setdefault(operation, LatencyTracker())
+        if len(tracker) < self._min_samples:
+            return None
+        return max(self._min_hedge_delay, tracker.quantile(self._hedge_quantile))
+
+    async def call(self,
+            operation: str,
+            make_request: Callable[[], Awaitable[T]],
+            expected: Tuple[Type[Exception], ...] = ())-> T:
+        """
+        Run a read, raising CircuitOpen if the circuit is open, and
+        asyncio.TimeoutError if the deadline is exceeded. Exceptions listed in
+        expected are outcomes rather than failures of the remote.
+        """
+        counts = self._counts.setdefault(operation, {"requests": 0, "hedged": 0, "hedge_wins": 0, "timeouts": 0, "failures": 0, "rejected": 0})
+
+        if not self.breaker.allow():
+            counts["rejected"] += 1
+            raise CircuitOpen(f"Circuit open, rejecting {operation}")
+
+        counts["requests"] += 1
+        delay = self.hedge_delay(operation)
+        latencies = self._latencies[operation]
+        deadline = self._deadlines[operation]
+        loop = asyncio.get_running_loop()
+        issued = False
+
+        async def attempt():
+            # Only the latency of the first request is recorded, since that
+            # of hedged calls would lower the quantile that the hedging delay
+            # is derived from. If it is cancelled, because a hedge won or the
+            # deadline passed, the time it had taken is recorded instead, as
+            # a lower bound of its latency.
+            nonlocal issued
+            first, issued = not issued, True
+            started = loop.time()
+            try:
+                result = await make_request(), None
+            except expected as outcome:
+                result = None, outcome
+            except asyncio.CancelledError:
+                if first:
+                    latencies.record(loop.time() - started)
+                raise
+            if first:
+                latencies.record(loop.time() - started)
+            return result
+
+        try:
+            (result, outcome), hedge_issued, hedge_won = await asyncio.wait_for(hedged(attempt, delay), deadline)
+        except asyncio.TimeoutError:
+            counts["timeouts"] += 1
+            self.breaker.failure()
+            raise
+        except Exception:
+            counts["failures"] += 1
+            self.breaker.failure()
+            raise
+
+        self.breaker.success()
+        counts["hedged"] += int(hedge_issued)
+        counts["hedge_wins"] += int(hedge_won)
+
+        if outcome is not None:
+            raise outcome
+        return result
+
+    def metrics(self)-> Dict[str, Dict]:
+        return {
+                "breaker": self.breaker.state,
+                "operations": {
+                    operation: {
+                        **counts,
+                        "hedge_rate": counts["hedged"] / counts["requests"] if counts["requests"] else 0,
+                        "hedge_delay": self.hedge_delay(operation),
+                        "p50": self._latencies[operation].quantile(.5),
+                        "p95": self._latencies[operation].quantile(.95),
+                    } for operation, counts in self._counts.items()
+                },
+            }
@@ -2,7 +2,7 @@ import asyncio
 from typing import Deque, Tuple, Optional, List
 from collections import deque
 import logging
-from . import remotes, caching, redis_locks
+from . import remotes, caching, redis_locks, result_buffer
 
 logger = logging.getLogger(__name__)
 
@@ -19,6 +19,11 @@ class JobHandler():
         retry_cooldown (int):     How long to wait between each retry
         max_retries (int):        How many times to retry a dependent job before failing
         check_errors_every (int): How often to check for errors when retrying
+        pipeline_uploads (bool):  Touch the next job while the previous one is being cached
+        max_inflight_uploads (int): How many cache uploads may run concurrently when pipelining
+        stats_smoothing (float):  Weight given to each new observation of task duration and size
+        cancel_abandoned (bool):  Stop waiting for a pending job once no client wants the chain
+        results (result_buffer.ResultBuffer): Buffer to hand computed results to waiting requests
 
     A class that handles the execution of chains of jobs via a locking system.
     """
@@ -28,7 +33,12 @@ class JobHandler():
             locks_client:       redis_locks.RedisLocks,
             retry_cooldown:     int = 5,
             max_retries:        int = 50,
-            check_errors_every: int = 5):
+            check_errors_every: int = 5,
+            pipeline_uploads:   bool = False,
+            max_inflight_uploads: int = 2,
+            stats_smoothing:    float = .2,
+            cancel_abandoned:   bool = False,
+            results:            Optional[result_buffer.ResultBuffer] = None):
 
         self._api_client: remotes.Api             = api_client
         self._cache_client: caching.RESTCache       = cache_client
@@ -38,6 +48,12 @@ class JobHandler():
         self._max_retries        = max_retries
         self._check_errors_every = check_errors_every
 
+        self._pipeline_uploads     = pipeline_uploads
+        self._max_inflight_uploads = max_inflight_uploads
+        self._stats_smoothing      = stats_smoothing
+        self._cancel_abandoned     = cancel_abandoned
+        self._results              = results
+
     async def close(self):
         """
         close
@@ -89,6 +105,7 @@ class JobHandler():
             if is_cached or in_progress:
                 if is_cached:
                     await self._locks_client.unlock(job)
+                    await self._locks_client.clear_error(job)
                     logger.info(f"{job} was cached")
                 if in_progress:
                     logger.info(f"{job} was in progress")
@@ -99,6 +116,33 @@ class JobHandler():
 
         return pending, todo
 
+    async def handle_chain(self, jobs: List[str])-> None:
+        """
+        handle_chain
+        ============
+
+        parameters:
+            jobs (List[str]): A list of jobs to do
+
+        Handles a chain of jobs (see handle_jobs), keeping the journal of
+        in-flight chains up to date. If the handler is cancelled, as when a
+        draining worker gives up on it, its locks are released and the chain
+        is handed off to another worker through the journal. Otherwise, the
+        chain is removed from the journal when done, whether it succeeded or
+        not.
+        """
+        handed_off = False
+        try:
+            await self.handle_jobs(jobs)
+        except asyncio.CancelledError:
+            handed_off = await self._locks_client.hand_off_chain(jobs)
+            raise
+        finally:
+            if not handed_off:
+                await self._locks_client.release_chain(jobs)
+            await self._locks_client.cleanup()
+            await self._locks_client.close()
+
     async def handle_jobs(self, jobs: List[str])-> None:
         """
         handle_jobs
@@ -115,7 +159,18 @@ class JobHandler():
            3 Recurse when pending job completes, removing locks (go to 1)
            4 If there is no pending job, and locks can be acquired, do the
              locked jobs.
-           5 Remove locks
+
+        Locks are left held when done, to be released by handle_chain, which
+        also closes the locks client.
+
+        If the cache cannot tell which jobs are cached in step 1, a retryable
+        503 error is flagged for the chain. While waiting in step 2, failing
+        checks of the cache count as the pending job not being done yet.
+
+        If cancel_abandoned is set, waiting in step 2 is given up (releasing
+        the locks) once no client has shown interest in the chain within the
+        interest window. Jobs that are already being computed are never
+        cancelled.
 
         The purpose is to first figure out what jobs are done and what jobs are
         being done, building a list (todo) which can the be dispatched with the
@@ -123,7 +178,13 @@ class JobHandler():
 
         """
 
-        pending, todo = await self.lock_jobs(jobs)
+        try:
+            pending, todo = await self.lock_jobs(jobs)
+        except caching.CacheUnavailable as e:
+            await self._locks_client.set_error(jobs[-1], 503, f"Could not check the cache for {jobs[-1]}: {e}")
+            return
+
+        await self._locks_client.journal_chain(jobs)
 
         if pending is not None and len(todo) > 0:
             logger.debug(f"Pending job: {pending}")
@@ -143,12 +204,19 @@ class JobHandler():
                         logger.critical(f"{pending} returned an error: {error}")
                         pending_succeeding = False
 
+                    if self._cancel_abandoned and not await self._locks_client.has_interest(jobs[-1]):
+                        logger.info(f"No remaining interest in {jobs[-1]}, stopping")
+                        pending_succeeding = False
+
                 if retries > self._max_retries:
                     logger.critical(f"Exceeded max retries while waiting for {pending}")
                     pending_succeeding = False
 
                 logger.info(f"Waiting for {pending}")
-                pending_was_finished = await self._cache_client.exists(pending)
+                try:
+                    pending_was_finished = await self._cache_client.exists(pending)
+                except caching.CacheUnavailable as e:
+                    logger.warning(f"Could not check whether {pending} is done: {e}")
 
                 await asyncio.sleep(self._retry_cooldown)
 
@@ -160,8 +228,6 @@ class JobHandler():
                 todo = deque()
 
         await self._do_jobs(todo)
-        await self._locks_client.cleanup()
-        await self._locks_client.close()
 
     async def _do_jobs(self, todo: Deque[str])-> None:
         """
@@ -171,19 +237,74 @@ class JobHandler():
         parameters:
             jobs (List[str])
 
-        Applies do_job for each job, posting errors if they occur.
-        """
-        for job in todo:
-            try:
-                status, content = await self._do_job(job)
-
-            except asyncio.exceptions.TimeoutError:
-                await self._locks_client.set_error(job, 503, f"{job} timed out")
-                break
-
-            if status == 200:
-                logger.info(f"Caching {job}")
-                await self._cache_client.set(job, content)
-            else:
-                await self._locks_client.set_error(job, status, content)
+        Applies do_job for each job, posting errors if they occur. Once a
+        result is cached, it is handed to the result buffer, if any, and the
+        duration and size of its job are recorded.
 
+        If uploads are pipelined, the result of each job is cached in the
+        background while the next job is touched, with at most
+        max_inflight_uploads uploads running at once. A failed upload stops
+        the chain. All uploads are awaited before returning, so that locks
+        are never released before the content is cached.
+        """
+        uploads: List[asyncio.Task] = []
+        slots = asyncio.Semaphore(self._max_inflight_uploads)
+
+        try:
+            for job in todo:
+                if self._failed_upload(uploads) is not None:
+                    break
+
+                started = asyncio.get_running_loop().time()
+                try:
+                    status, content = await self._do_job(job)
+
+                except asyncio.exceptions.TimeoutError:
+                    await self._locks_client.set_error(job, 503, f"{job} timed out")
+                    break
+
+                if status == 200:
+                    duration = asyncio.get_running_loop().time() - started
+                    etag = caching.content_etag(content)
+                    if self._pipeline_uploads:
+                        await slots.acquire()
+                        upload = asyncio.create_task(self._upload(job, content, etag, duration), name = job)
+                        upload.add_done_callback(lambda _: slots.release())
+                        uploads.append(upload)
+                    else:
+                        await self._upload(job, content, etag, duration)
+                else:
+                    await self._locks_client.set_error(job, status, content)
+
+            if uploads:
+                await asyncio.wait(uploads)
+
+            if (failed := self._failed_upload(uploads)) is not None:
+                job, error = failed
+                await self._locks_client.set_error(job, 500, f"Failed to cache {job}: {error}")
+
+        finally:
+            for upload in uploads:
+                upload.cancel()
+
+    async def _upload(self, job: str, content: bytes, etag: str, duration: float)-> None:
+        logger.info(f"Caching {job}")
+        await self._cache_client.set(job, content)
+        if self._results is not None:
+            self._results.put(job, content, etag)
+        await self._locks_client.clear_error(job)
+        await self._locks_client.set_etag(job, etag)
+        await self._record_task(job, duration, len(content))
+
+    async def _record_task(self, job: str, duration: float, size: int)-> None:
+        # Statistics are only used for estimates, and must never fail a job
+        try:
+            await self._locks_client.record_task(job, duration, size, self._stats_smoothing)
+        except Exception as e:
+            logger.error(f"Failed to record statistics for {job}: {e}")
+
+    def _failed_upload(self, uploads: List[asyncio.Task])-> Optional[Tuple[str, BaseException]]:
+        for upload in uploads:
+            if upload.done() and not upload.cancelled() and (error := upload.exception()) is not None:
+                return upload.get_name(), error
+        return None
@@ -0,0 +1,166 @@
+import asyncio
+from typing import Set, Coroutine, Callable, Awaitable, List, Optional
+import logging
+from . import redis_locks
+
+logger = logging.getLogger(__name__)
+
+class Draining(Exception):
+    pass
+
+class Worker():
+    """
+    Worker
+    ======
+
+    parameters:
+        worker_id (str):          Identity of this worker, used as lock owner and in the journal
+        drain_timeout (int):      How long to wait for running chains on shutdown before handing them off
+        heartbeat_interval (int): How often to signal that this worker is alive
+
+    Keeps track of the chains this worker is running, so that they can be
+    drained on shutdown, and of other workers, so that chains left behind by
+    workers that died can be recovered.
+    """
+    def __init__(self,
+            worker_id: str,
+            drain_timeout: int = 20,
+            heartbeat_interval: int = 10):
+
+        self.worker_id = worker_id
+        self.draining  = False
+
+        self._drain_timeout      = drain_timeout
+        self._heartbeat_interval = heartbeat_interval
+
+        self._tasks: Set[asyncio.Task]          = set()
+        self._heartbeat: Optional[asyncio.Task] = None
+
+    @property
+    def busy(self)-> bool:
+        return len(self._tasks) > 0
+
+    def dispatch(self, coro: Coroutine)-> asyncio.Task:
+        """
+        dispatch
+        ========
+
+        parameters:
+            coro (Coroutine): Work to run in the background
+
+        returns:
+            asyncio.Task
+
+        Run a coroutine in the background, keeping track of it until it
+        completes. Raises Draining if the worker is shutting down.
+        """
+        if self.draining:
+            coro.close()
+            raise Draining
+
+        task = asyncio.create_task(coro)
+        self._tasks.add(task)
+        task.add_done_callback(self._tasks.discard)
+        return task
+
+    async def start(self,
+            get_locks: Callable[[], redis_locks.RedisLocks],
+            resume: Callable[[List[str]], Awaitable[None]])-> None:
+        """
+        start
+        =====
+
+        parameters:
+            get_locks (Callable[[], RedisLocks]):    Locks client factory
+            resume (Callable[[List[str]], Awaitable]): Dispatches a chain of jobs
+
+        Start sending heartbeats. Each heartbeat is followed by a recovery
+        pass, the first one happening immediately on startup.
+        """
+        self._heartbeat = asyncio.create_task(self._beat(get_locks, resume))
+
+    async def drain(self, get_locks: Callable[[], redis_locks.RedisLocks])-> None:
+        """
+        drain
+        =====
+
+        parameters:
+            get_locks (Callable[[], RedisLocks]): Locks client factory
+
+        Stop accepting new work and wait for running chains to finish. Chains
+        still running after the drain timeout are cancelled, which releases
+        their locks and leaves them in the journal for another worker to
+        resume.
+        """
+        self.draining = True
+
+        if self._tasks:
+            logger.info(f"Draining {len(self._tasks)} running chains")
+            _, still_running = await asyncio.wait(self._tasks, timeout = self._drain_timeout)
+
+            for task in still_running:
+                task.cancel()
+            if still_running:
+                logger.warning(f"Handing off {len(still_running)} chains still running after {self._drain_timeout}s")
+                await asyncio.gather(*still_running, return_exceptions = True)
+
+        if self._heartbeat is not None:
+            self._heartbeat.cancel()
+
+        locks = get_locks()
+        try:
+            await locks.retire()
+        finally:
+            await locks.close()
+
+    async def recover(self,
+            get_locks: Callable[[], redis_locks.RedisLocks],
+            resume: Callable[[List[str]], Awaitable[None]])-> None:
+        """
+        recover
+        =======
+
+        parameters:
+            get_locks (Callable[[], RedisLocks]):    Locks client factory
+            resume (Callable[[List[str]], Awaitable]): Dispatches a chain of jobs
+
+        Look for journaled chains whose owners are no longer alive. Each such
+        chain is claimed, its orphaned locks are released and it is
+        dispatched again on this worker.
+        """
+        locks = get_locks()
+        try:
+            alive = await locks.live_workers() | {self.worker_id}
+            chains = await locks.journaled_chains()
+
+            for field, entry in chains.items():
+                if self.draining:
+                    break
+
+                if entry.owner in alive:
+                    continue
+
+                claimed = await locks.claim_chain(field)
+                if claimed is None:
+                    continue
+
+                logger.warning(f"Recovering {claimed.jobs[-1]}, orphaned by {claimed.owner}")
+                await locks.release_orphaned(claimed)
+                self.dispatch(resume(claimed.jobs))
+        finally:
+            await locks.close()
+
+    async def _beat(self,
+            get_locks: Callable[[], redis_locks.RedisLocks],
+            resume: Callable[[List[str]], Awaitable[None]])-> None:
+        locks = get_locks()
+        try:
+            while True:
+                try:
+                    await locks.heartbeat(self._heartbeat_interval * 3)
+                    await self.recover(get_locks, resume)
+                except Exception as e:
+                    logger.error(f"Heartbeat failed: {e}")
+                await asyncio.sleep(self._heartbeat_interval)
+        finally:
+            await locks.close()
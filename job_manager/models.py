@@ -1,5 +1,6 @@
 
 import datetime
+from typing import List
 from pydantic import BaseModel, validator
 
 class Error(BaseModel):
@@ -22,3 +23,12 @@ class Error(BaseModel):
         assert str(v)[0] == "5"
         return v
         """
+
+class JournalEntry(BaseModel):
+    """
+    An in-flight chain, as recorded in the journal by the worker running it.
+    """
+    owner:      str
+    jobs:       List[str]
+    locked:     List[str] = []
+    started_at: datetime.datetime
@@ -48,3 +48,11 @@ def parse_path(path: str)-> Tuple[str, List[Task]]:
 def subjobs(path: str) -> List[str]:
     loa, tasks = parse_path(path)
     return [tasks_to_path(loa, tasks[-i-1:]) for i in range(len(tasks))]
+
+def chain_tag(path: str) -> str:
+    """
+    Returns the level of analysis and base task of a path, which is shared by
+    all subjobs of the chain the path belongs to
+    """
+    loa, tasks = parse_path(path)
+    return tasks_to_path(loa, tasks[-1:])
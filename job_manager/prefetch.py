@@ -0,0 +1,191 @@
+"""
+Warm the cache with chains before they are requested.
+
+Examples:
+    python -m job_manager.prefetch warm paths.txt
+    python -m job_manager.prefetch candidates --log access.jsonl
+"""
+import time
+import asyncio
+import logging
+import argparse
+from typing import Awaitable, Callable, Deque, Dict, List, Optional, Tuple
+from collections import deque
+from . import access_history, caching, lifecycle, parse
+
+logger = logging.getLogger(__name__)
+
+class Warmer():
+    """
+    Warmer
+    ======
+
+    parameters:
+        worker (lifecycle.Worker):   The worker whose idle capacity is used
+        log_path (str):              Access log to learn from
+        warm (Callable):             Dispatches a chain of jobs at low priority
+        get_cache (Callable):        Cache client factory
+        idle_after (float):          Seconds without real requests before warming
+        interval (float):            Seconds between checks for idle capacity
+        relearn_interval (float):    Seconds between reading the access log
+        half_life (float):           Seconds after which a past request counts half as much
+        successor_window (float):    Seconds after a request in which extensions of it count as its successors
+        min_score (float):           Minimum (decayed) request count for a chain to be warmed
+        min_successor_count (int):   Minimum times a chain must have followed another to be warmed after it
+
+    Warms frequently requested chains, and common successors of requested
+    chains, one at a time while the worker is idle. Chains are dispatched
+    like requested ones, so locks held by other handlers are respected. No
+    new chain is warmed while real requests keep arriving, but a chain that
+    is already being warmed runs to completion.
+    """
+    def __init__(self,
+            worker: lifecycle.Worker,
+            log_path: str,
+            warm: Callable[[List[str]], Awaitable[None]],
+            get_cache: Callable[[], caching.RESTCache],
+            idle_after: float = 30,
+            interval: float = 10,
+            relearn_interval: float = 3600,
+            half_life: float = 30 * 86400,
+            successor_window: float = 3600,
+            min_score: float = 2,
+            min_successor_count: int = 2):
+
+        self._worker = worker
+        self._log_path = log_path
+        self._warm = warm
+        self._get_cache = get_cache
+
+        self._idle_after = idle_after
+        self._interval = interval
+        self._relearn_interval = relearn_interval
+        self._min_score = min_score
+        self._min_successor_count = min_successor_count
+
+        self._half_life = half_life
+        self._successor_window = successor_window
+
+        self._history = access_history.History(half_life, successor_window)
+        self._learned_at: Optional[float] = None
+        self._last_request = time.monotonic()
+
+        self._queue: Deque[str] = deque()
+        self._warmed: Dict[str, float] = {}
+        self._task: Optional[asyncio.Task] = None
+
+    def notice_request(self, path: str)-> None:
+        """
+        Note that a real request arrived, and queue its common successors
+        """
+        self._last_request = time.monotonic()
+        for successor in self._history.successors_of(path, self._min_successor_count):
+            if successor not in self._queue:
+                self._queue.appendleft(successor)
+
+    @property
+    def idle(self)-> bool:
+        return not self._worker.busy and time.monotonic() - self._last_request >= self._idle_after
+
+    def start(self)-> None:
+        self._task = asyncio.create_task(self._run())
+
+    def stop(self)-> None:
+        if self._task is not None:
+            self._task.cancel()
+
+    async def _learn(self)-> None:
+        # Requests older than eight half lives weigh less than 0.4%
+        since = time.time() - 8 * self._half_life
+        self._history, n_requests = await asyncio.get_running_loop().run_in_executor(None, self._read_history, since)
+        self._learned_at = time.monotonic()
+
+        for chain in self._history.frequent(self._min_score):
+            if chain not in self._queue:
+                self._queue.append(chain)
+        logger.info(f"Learned from {n_requests} requests, {len(self._queue)} chains queued for warming")
+
+    def _read_history(self, since: float)-> Tuple[access_history.History, int]:
+        entries = list(access_history.read(self._log_path, since))
+        history = access_history.History(self._half_life, self._successor_window)
+        return history.learn(entries), len(entries)
+
+    async def _next(self)-> Optional[str]:
+        cache = self._get_cache()
+        while self._queue:
+            path = self._queue.popleft()
+            if time.monotonic() - self._warmed.get(path, -self._relearn_interval) < self._relearn_interval:
+                continue
+            try:
+                final = parse.subjobs(path)[-1]
+            except parse.ParsingError:
+                continue
+            if not await cache.exists(final):
+                return path
+        return None
+
+    async def _run(self)-> None:
+        while True:
+            try:
+                if self._learned_at is None or time.monotonic() - self._learned_at > self._relearn_interval:
+                    await self._learn()
+
+                if self.idle and (path := await self._next()) is not None:
+                    logger.info(f"Warming {path}")
+                    self._warmed[path] = time.monotonic()
+                    self._worker.dispatch(self._warm(parse.subjobs(path)))
+            except lifecycle.Draining:
+                return
+            except Exception as e:
+                logger.error(f"Warming failed: {e}")
+            await asyncio.sleep(self._interval)
+
+async def warm_paths(paths: List[str], concurrency: int = 1)-> None:
+    """
+    Dispatch a list of chains from this process, a few at a time
+    """
+    from . import app
+
+    slots = asyncio.Semaphore(concurrency)
+
+    async def warm(path: str):
+        async with slots:
+            try:
+                jobs = parse.subjobs(path)
+            except parse.ParsingError:
+                logger.error(f"Could not parse as job path: {path}")
+                return
+            logger.info(f"Warming {path}")
+            await app.warm_jobs(jobs)
+
+    await asyncio.gather(*[warm(p) for p in paths])
+
+def main(argv = None):
+    parser = argparse.ArgumentParser(prog = "python -m job_manager.prefetch", description = __doc__,
+            formatter_class = argparse.RawDescriptionHelpFormatter)
+    commands = parser.add_subparsers(dest = "command", required = True)
+
+    warm = commands.add_parser("warm", help = "Compute a list of chains, skipping cached and locked jobs")
+    warm.add_argument("paths", type = argparse.FileType("r"), help = "File with one job path per line (- for stdin)")
+    warm.add_argument("--concurrency", type = int, default = 1)
+
+    candidates = commands.add_parser("candidates", help = "Show the chains that would be warmed")
+    candidates.add_argument("--log", required = True, help = "Access log to learn from")
+    candidates.add_argument("--min-score", type = float, default = 2)
+    candidates.add_argument("--half-life", type = float, default = 30 * 86400, help = "Seconds")
+
+    args = parser.parse_args(argv)
+    logging.basicConfig(level = logging.INFO)
+
+    if args.command == "warm":
+        paths = [line.strip().strip("/") for line in args.paths if line.strip()]
+        asyncio.run(warm_paths(paths, args.concurrency))
+    else:
+        history = access_history.History(args.half_life).learn(list(access_history.read(args.log)))
+        for chain in history.frequent(args.min_score):
+            print(f"{history.scores[chain]:8.2f} {chain}")
+            for successor in history.successors_of(chain, 2):
+                print(f"{'':8} -> {successor}")
+
+if __name__ == "__main__":
+    main()
@@ -1,13 +1,36 @@
 import asyncio
 import json
+import uuid
 from typing import List, Optional, Set, Dict
 import logging
 from datetime import datetime
 import aioredis
-from . import models
+from . import models, stats, parse
 
 logger = logging.getLogger(__name__)
 
+# Folds an observation into the statistics of a task held in a hash field,
+# atomically, following stats.TaskStats.update.
+# KEYS: stats hash, ARGV: task key, duration, size, alpha
+RECORD_TASK_SCRIPT = """
+local raw = redis.call("HGET", KEYS[1], ARGV[1])
+local duration, size, alpha = tonumber(ARGV[2]), tonumber(ARGV[3]), tonumber(ARGV[4])
+local s = raw and cjson.decode(raw) or {count = 0}
+
+if s.count == 0 then
+    s = {count = 1, mean_duration = duration, var_duration = 0, mean_size = size}
+else
+    local diff = duration - s.mean_duration
+    local increment = alpha * diff
+    s.count = s.count + 1
+    s.mean_duration = s.mean_duration + increment
+    s.var_duration = (1 - alpha) * (s.var_duration + diff * increment)
+    s.mean_size = s.mean_size + alpha * (size - s.mean_size)
+end
+
+redis.call("HSET", KEYS[1], ARGV[1], cjson.encode(s))
+"""
+
 class RedisLocks():
     """
     RedisLocks
@@ -17,9 +40,25 @@ class RedisLocks():
         host (str):         Redis hostname
         port (int):         Redis port
         db (int):           Redis DB
+        cluster (bool):     Connect to a Redis Cluster, with host and port pointing to one of its nodes
 
         error_prefix (str): Key prefix to add to error entries
         job_prefix (str):   Key prefix to add to job entries
+        journal_key (str):  Key of the hash journaling in-flight chains
+        worker_prefix (str):Key prefix to add to worker heartbeat entries
+        owner (str):        Identity of the worker using this client
+        stats_key (str):    Key of the hash holding task duration statistics
+        etag_prefix (str):  Key prefix to add to stored ETags
+        interest_prefix (str): Key prefix to add to client interest entries
+        node_prefix (str):  Key prefix to add to manager node heartbeat entries
+        connection:         A Redis client to use, instead of connecting to host and port
+
+    Each client journals the chain it handles under its own field, so that
+    several handlers of the same chain do not overwrite each other's entries.
+
+    Keys concerning a job are hash-tagged with the level of analysis and base
+    task of its chain (see parse.chain_tag), so that all keys of a chain live
+    in the same Redis Cluster slot.
     """
 
     def __init__(self,
@@ -27,21 +66,40 @@ class RedisLocks():
             port: int,
             db: int,
             error_prefix: str = "jobman/errors:",
-            job_prefix: str = "jobman/jobs:"):
-
-        self._active_connection = None
+            job_prefix: str = "jobman/jobs:",
+            journal_key: str = "jobman/inflight",
+            worker_prefix: str = "jobman/workers:",
+            owner: str = "anonymous",
+            stats_key: str = "jobman/stats",
+            etag_prefix: str = "jobman/etags:",
+            interest_prefix: str = "jobman/interest:",
+            cluster: bool = False,
+            node_prefix: str = "jobman/nodes:",
+            connection = None):
+
+        self._active_connection = connection
 
         self._host = host
         self._port = port
         self._db = db
+        self._cluster = cluster
 
         self._has_locked: Set[str]            = set()
+        self._handler_id: str                 = uuid.uuid4().hex[:8]
 
         self._job_prefix: str                 = job_prefix
         self._error_prefix: str               = error_prefix
+        self._journal_key: str                = journal_key
+        self._worker_prefix: str              = worker_prefix
+        self._owner: str                      = owner
+        self._stats_key: str                  = stats_key
+        self._etag_prefix: str                = etag_prefix
+        self._interest_prefix: str            = interest_prefix
+        self._node_prefix: str                = node_prefix
 
         self._error_expiry_time: int          = 400
         self._job_expiry_time: int            = 400
+        self._etag_expiry_time: int           = 86400
 
     async def close(self):
         """
@@ -64,9 +122,7 @@ class RedisLocks():
         returns:
             List[str]
         """
-        connection = await self._connection()
-
-        return self._unpack_keys(await connection.keys(self._jobname("*")))
+        return [self._untagged(self._job_prefix, k) for k in await self._scan(self._job_prefix + "*")]
 
     async def lock(self, job)-> bool:
         """
@@ -86,7 +142,7 @@ class RedisLocks():
 
         did_lock = await connection.set(
                 self._jobname(job),
-                str(datetime.now()),
+                f"{self._owner}@{datetime.now()}",
                 nx = True,
                 ex = self._job_expiry_time)
 
@@ -111,7 +167,7 @@ class RedisLocks():
         """
         connection = await self._connection()
 
-        if job in self._has_locked and not force:
+        if job in self._has_locked or force:
             await connection.delete(self._jobname(job))
             self._has_locked = self._has_locked - {job}
             return True
@@ -125,8 +181,309 @@ class RedisLocks():
 
         Unlock all jobs that have been locked with this client.
         """
-        for job in self._has_locked:
-            await self.unlock(job)
+        if self._has_locked:
+            connection = await self._connection()
+            # All jobs locked by a client belong to the same chain, and thus the same slot
+            await connection.delete(*[self._jobname(job) for job in self._has_locked])
+            self._has_locked = set()
+
+    async def journal_chain(self, jobs: List[str])-> None:
+        """
+        journal_chain
+        =============
+
+        parameters:
+            jobs (List[str]): The chain of jobs being handled
+
+        Record the chain as in-flight for this client, along with the locks
+        currently held for it, so that it can be recovered if the worker
+        disappears. A client holding no locks has nothing to recover, and its
+        entry is removed instead.
+        """
+        connection = await self._connection()
+
+        if not self._has_locked:
+            await connection.hdel(self._journal_key, self._journal_field(jobs))
+            return
+
+        entry = models.JournalEntry(
+                owner = self._owner,
+                jobs = jobs,
+                locked = sorted(self._has_locked),
+                started_at = datetime.now())
+
+        await connection.hset(self._journal_key, self._journal_field(jobs), entry.json())
+
+    async def hand_off_chain(self, jobs: List[str])-> bool:
+        """
+        hand_off_chain
+        ==============
+
+        parameters:
+            jobs (List[str]): The chain of jobs being handled
+
+        returns:
+            bool: Was the chain left in the journal?
+
+        Release the locks held for the chain, but leave it in the journal
+        (without locks) so that it is resumed by another worker. Chains for
+        which this client held no locks are being handled elsewhere, and are
+        not handed off.
+        """
+        held_locks = len(self._has_locked) > 0
+        await self.cleanup()
+
+        if held_locks:
+            connection = await self._connection()
+            entry = models.JournalEntry(
+                    owner = self._owner,
+                    jobs = jobs,
+                    locked = [],
+                    started_at = datetime.now())
+            await connection.hset(self._journal_key, self._journal_field(jobs), entry.json())
+        return held_locks
+
+    async def release_chain(self, jobs: List[str])-> None:
+        """
+        release_chain
+        =============
+
+        parameters:
+            jobs (List[str]): The chain of jobs that was handled
+
+        Remove this client's entry for the chain from the journal of
+        in-flight chains.
+        """
+        connection = await self._connection()
+        await connection.hdel(self._journal_key, self._journal_field(jobs))
+
+    async def journaled_chains(self)-> Dict[str, models.JournalEntry]:
+        """
+        journaled_chains
+        ================
+
+        returns:
+            Dict[str, models.JournalEntry]: In-flight chains, keyed by journal field
+        """
+        connection = await self._connection()
+
+        raw_entries = await connection.hgetall(self._journal_key)
+        return {k.decode(): models.JournalEntry(**json.loads(v.decode())) for k,v in raw_entries.items()}
+
+    async def claim_chain(self, field: str)-> Optional[models.JournalEntry]:
+        """
+        claim_chain
+        ===========
+
+        parameters:
+            field (str): The journal field of an in-flight chain, as returned by journaled_chains
+
+        returns:
+            Optional[models.JournalEntry]: The entry, if this client was the one to remove it
+
+        Atomically take over a journaled chain. Only one client can claim a
+        given entry, so that orphaned chains are only recovered once.
+        """
+        connection = await self._connection()
+
+        raw_entry = await connection.hget(self._journal_key, field)
+        if raw_entry is None:
+            return None
+
+        if await connection.hdel(self._journal_key, field) == 1:
+            return models.JournalEntry(**json.loads(raw_entry.decode()))
+        else:
+            return None
+
+    async def release_orphaned(self, entry: models.JournalEntry)-> None:
+        """
+        release_orphaned
+        ================
+
+        parameters:
+            entry (models.JournalEntry): A claimed journal entry
+
+        Remove the locks held by the (dead) owner of a journal entry. Locks
+        that have since expired and been taken by another worker are left
+        alone.
+        """
+        connection = await self._connection()
+
+        for job in entry.locked:
+            holder = await connection.get(self._jobname(job))
+            if holder is not None and holder.decode().split("@")[0] == entry.owner:
+                logger.warning(f"Releasing orphaned lock on {job} held by {entry.owner}")
+                await connection.delete(self._jobname(job))
+
+    async def heartbeat(self, ttl: int)-> None:
+        """
+        heartbeat
+        =========
+
+        parameters:
+            ttl (int): Seconds until this worker is considered dead
+
+        Signal that the worker owning this client is alive.
+        """
+        connection = await self._connection()
+        await connection.set(self._workername(self._owner), str(datetime.now()), ex = ttl)
+
+    async def retire(self)-> None:
+        """
+        retire
+        ======
+
+        Signal that the worker owning this client has shut down.
+        """
+        connection = await self._connection()
+        await connection.delete(self._workername(self._owner))
+
+    async def live_workers(self)-> Set[str]:
+        """
+        live_workers
+        ============
+
+        returns:
+            Set[str]: Identities of workers with a current heartbeat
+        """
+        keys = await self._scan(self._workername("*"))
+        return {k.replace(self._worker_prefix, "", 1) for k in keys}
+
+    async def record_task(self, job: str, duration: float, size: int, alpha: float = .2)-> None:
+        """
+        record_task
+        ===========
+
+        parameters:
+            job (str):        The job that was computed
+            duration (float): How long computing the job took, in seconds
+            size (int):       Size of the resulting artifact, in bytes
+            alpha (float):    Weight given to the new observation
+
+        Fold an observation into the statistics for the task computed by a
+        job. The update is done by a script, so that concurrent observations
+        from several workers are not lost.
+        """
+        connection = await self._connection()
+        await connection.eval(RECORD_TASK_SCRIPT, 1, self._stats_key, stats.job_task_key(job), duration, size, alpha)
+
+    async def task_stats(self, keys: Optional[List[str]] = None)-> Dict[str, stats.TaskStats]:
+        """
+        task_stats
+        ==========
+
+        parameters:
+            keys (Optional[List[str]]): Task keys (namespace/name) to fetch, defaults to all
+
+        returns:
+            Dict[str, stats.TaskStats]
+        """
+        connection = await self._connection()
+
+        if keys is None:
+            raw_stats = await connection.hgetall(self._stats_key)
+        else:
+            raw_stats = dict(zip(keys, await connection.hmget(self._stats_key, keys)))
+
+        return {(k.decode() if isinstance(k, bytes) else k): stats.TaskStats(**json.loads(v.decode()))
+                for k,v in raw_stats.items() if v is not None}
+
+    async def register_interest(self, chain: str, window: int)-> None:
+        """
+        register_interest
+        =================
+
+        parameters:
+            chain (str):   The final job of a requested chain
+            window (int):  Seconds until the interest expires, unless refreshed
+
+        Signal that a client still wants the result of a chain.
+        """
+        connection = await self._connection()
+        await connection.set(self._interestname(chain), str(datetime.now()), ex = window)
+
+    async def has_interest(self, chain: str)-> bool:
+        """
+        has_interest
+        ============
+
+        parameters:
+            chain (str): The final job of a chain
+
+        returns:
+            bool: Does any client still want the result of the chain?
+        """
+        connection = await self._connection()
+        return await connection.get(self._interestname(chain)) is not None
+
+    async def get_etag(self, job: str)-> Optional[str]:
+        """
+        get_etag
+        ========
+
+        parameters:
+            job (str): The name of the job
+
+        returns:
+            Optional[str]: The stored ETag of the job's cached content
+        """
+        connection = await self._connection()
+        etag = await connection.get(self._etagname(job))
+        return etag.decode() if etag is not None else None
+
+    async def set_etag(self, job: str, etag: str)-> None:
+        """
+        set_etag
+        ========
+
+        parameters:
+            job (str):  The name of the job
+            etag (str): ETag of the job's cached content
+
+        Store the ETag of a job's cached content, for caches that do not
+        provide their own. Stored ETags expire, and are computed again from
+        the content when it is next served.
+        """
+        connection = await self._connection()
+        await connection.set(self._etagname(job), etag, ex = self._etag_expiry_time)
+
+    async def announce_node(self, url: str, ttl: int)-> None:
+        """
+        announce_node
+        =============
+
+        parameters:
+            url (str): URL at which a manager node can be reached
+            ttl (int): Seconds until the node is considered gone
+
+        Signal that a manager node is part of the cluster.
+        """
+        connection = await self._connection()
+        await connection.set(self._node_prefix + url, str(datetime.now()), ex = ttl)
+
+    async def remove_node(self, url: str)-> None:
+        """
+        remove_node
+        ===========
+
+        parameters:
+            url (str): URL of a manager node
+
+        Signal that a manager node has left the cluster.
+        """
+        connection = await self._connection()
+        await connection.delete(self._node_prefix + url)
+
+    async def live_nodes(self)-> Set[str]:
+        """
+        live_nodes
+        ==========
+
+        returns:
+            Set[str]: URLs of manager nodes with a current heartbeat
+        """
+        keys = await self._scan(self._node_prefix + "*")
+        return {k.replace(self._node_prefix, "", 1) for k in keys}
 
     async def error_keys(self)-> List[str]:
         """
@@ -136,11 +493,9 @@ class RedisLocks():
         returns:
             List[str]: A list of currently defined error keys
         """
-        connection = await self._connection()
-
-        error_keys = await connection.keys(self._errorname("*"))
+        error_keys = await self._scan(self._error_prefix + "*")
         logger.debug(f"Found {len(error_keys)} errors")
-        return [self._strip_error_prefix(k.decode()) for k in error_keys]
+        return [self._untagged(self._error_prefix, k) for k in error_keys]
 
     async def errors(self)-> Dict[str, models.Error]:
         """
@@ -181,6 +536,19 @@ class RedisLocks():
         for k in keys:
             await connection.delete(self._errorname(k))
 
+    async def clear_error(self, job: str)-> None:
+        """
+        clear_error
+        ===========
+
+        parameters:
+            job (str):     The name of the job
+
+        Clear the error flag of a job, as when it has since succeeded
+        """
+        connection = await self._connection()
+        await connection.delete(self._errorname(job))
+
     async def get_error(self, job: str)-> Optional[models.Error]:
         """
         get_error
@@ -214,14 +582,18 @@ class RedisLocks():
             status (int):  The HTTP error code to associate with the error flag
             message (str): The message to post with the error flag
 
-        Flag an error condition for a job
+        Flag an error condition for a job. The retry count of a current error
+        of the job is carried over, so that a job failing again after being
+        retried still counts towards the maximum number of retries.
 
         """
-        error = models.Error(http_status_code = status, message = message, posted_at = datetime.now())
+        previous = await self.get_error(job)
+        error = models.Error(http_status_code = status, message = message, posted_at = datetime.now(),
+                retries = previous.retries if previous is not None else 0)
         logger.critical(f"Job {job} returned error {error}")
         return await self.update_error(job, error)
 
-    async def update_error(self, job: str, error: models.Error):
+    async def update_error(self, job: str, error: models.Error, keep_expiry: bool = False):
         """
         update_error
         ============
@@ -229,20 +601,41 @@ class RedisLocks():
         parameters:
             job (str):            The name of the job
             error (models.Error): A models.Error object to set to the key.
+            keep_expiry (bool):   Update an existing error flag without extending its lifetime
 
         Flag an error condition for a job
 
         """
 
         connection = await self._connection()
-        await connection.set(self._errorname(job), error.json(), ex = self._error_expiry_time)
+        if keep_expiry:
+            await connection.set(self._errorname(job), error.json(), xx = True, keepttl = True)
+        else:
+            await connection.set(self._errorname(job), error.json(), ex = self._error_expiry_time)
 
     async def retry_error(self, job: str, max_retries: int, cooldown: int)-> Optional[models.Error]:
+        """
+        retry_error
+        ===========
+
+        parameters:
+            job (str):         The name of the job
+            max_retries (int): How many times a retryable error may be retried
+            cooldown (int):    How long to wait before retrying
+
+        returns:
+            Optional[models.Error]: The error of the job, if it may not be retried
+
+        Each retry of a retryable error is counted in Redis, across requests
+        and workers, so that the error is returned once it has been retried
+        max_retries times, until it expires.
+        """
         error = await self.get_error(job)
         if error:
             if error.retryable and error.retries < max_retries:
-                logger.warning("Retrying job after error: {error} (sleeping {cooldown} seconds...)")
+                logger.warning(f"Retrying job after error: {error} (sleeping {cooldown} seconds...)")
                 error.retries += 1
+                await self.update_error(job, error, keep_expiry = True)
                 await asyncio.sleep(cooldown)
                 return None
             else:
@@ -250,21 +643,52 @@ class RedisLocks():
         else:
             return None
 
+    def _journal_field(self, jobs: List[str])-> str:
+        return f"{self._owner}/{self._handler_id}:{jobs[-1]}"
+
     def _jobname(self, jobname: str):
-        return self._job_prefix + jobname
+        return self._tagged(self._job_prefix, jobname)
 
     def _errorname(self, errorname: str):
-        return self._error_prefix + errorname
+        return self._tagged(self._error_prefix, errorname)
+
+    def _interestname(self, interestname: str):
+        return self._tagged(self._interest_prefix, interestname)
+
+    def _etagname(self, etagname: str):
+        return self._tagged(self._etag_prefix, etagname)
+
+    def _workername(self, workername: str):
+        return self._worker_prefix + workername
 
-    def _strip_error_prefix(self, key: str)-> str:
-        return key.replace(self._error_prefix,"")
+    def _tagged(self, prefix: str, job: str)-> str:
+        try:
+            return prefix + "{" + parse.chain_tag(job) + "}" + job
+        except parse.ParsingError:
+            return prefix + job
 
-    def _unpack_keys(self, keys):
-        return [*keys]
+    def _untagged(self, prefix: str, key: str)-> str:
+        name = key.replace(prefix, "", 1)
+        if name.startswith("{"):
+            name = name[name.index("}") + 1:]
+        return name
+
+    async def _scan(self, pattern: str)-> List[str]:
+        """
+        Returns keys matching a pattern. On a cluster, this scans all nodes.
+        """
+        connection = await self._connection()
+        return [k.decode() async for k in connection.scan_iter(match = pattern)]
 
     async def _connection(self):
         if self._active_connection is None:
-            url = f"redis://{self._host}:{self._port}/{self._db}"
-            logger.debug(f"Connecting to Redis at {url}")
-            self._active_connection = await aioredis.Redis.from_url(url)
+            if self._cluster:
+                from redis.asyncio.cluster import RedisCluster
+                url = f"redis://{self._host}:{self._port}"
+                logger.debug(f"Connecting to Redis Cluster at {url}")
+                self._active_connection = RedisCluster.from_url(url)
+            else:
+                url = f"redis://{self._host}:{self._port}/{self._db}"
+                logger.debug(f"Connecting to Redis at {url}")
+                self._active_connection = await aioredis.Redis.from_url(url)
         return self._active_connection
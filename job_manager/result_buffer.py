@@ -0,0 +1,67 @@
+import time
+from typing import Optional, Tuple
+from collections import OrderedDict
+
+class ResultBuffer():
+    """
+    ResultBuffer
+    ============
+
+    parameters:
+        max_bytes (int): Total size of the content that may be held
+        ttl (float):     Seconds an entry is held after being stored
+
+    Holds just-computed results in memory, so that requests arriving right
+    after they are cached are served without a round trip to the cache.
+    Least recently stored entries are evicted first when full.
+    """
+    def __init__(self, max_bytes: int, ttl: float):
+        self._max_bytes = max_bytes
+        self._ttl = ttl
+        self._entries: "OrderedDict[str, Tuple[bytes, str, float]]" = OrderedDict()
+        self._size = 0
+
+    def __len__(self):
+        self._expire()
+        return len(self._entries)
+
+    @property
+    def size(self)-> int:
+        return self._size
+
+    def put(self, job: str, content: bytes, etag: str)-> None:
+        """
+        Store content, unless it is larger than the whole buffer
+        """
+        self._remove(job)
+        if len(content) > self._max_bytes:
+            return
+
+        self._entries[job] = (content, etag, time.monotonic() + self._ttl)
+        self._size += len(content)
+
+        while self._size > self._max_bytes:
+            self._remove(next(iter(self._entries)))
+
+    def get(self, job: str)-> Optional[Tuple[bytes, str]]:
+        """
+        Returns the content and ETag of a job, if held
+        """
+        self._expire()
+        try:
+            content, etag, _ = self._entries[job]
+        except KeyError:
+            return None
+        return content, etag
+
+    def _expire(self)-> None:
+        now = time.monotonic()
+        while self._entries:
+            job, (_, _, expires_at) = next(iter(self._entries.items()))
+            if expires_at > now:
+                break
+            self._remove(job)
+
+    def _remove(self, job: str)-> None:
+        if (entry := self._entries.pop(job, None)) is not None:
+            self._size -= len(entry[0])
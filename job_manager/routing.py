@@ -0,0 +1,120 @@
+import asyncio
+import logging
+from typing import Callable, Dict, List, Optional, Tuple
+import aiohttp
+from . import redis_locks, hashring
+
+logger = logging.getLogger(__name__)
+
+FORWARDED_HEADER = "X-Jobman-Forwarded"
+
+# Marks redirected requests, which are served by the node they are sent to
+REDIRECTED_PARAM = "jobman-redirected"
+
+_RELAYED_RESPONSE_HEADERS = ["Content-Type", "ETag", "Content-Range", "Retry-After"]
+
+class NodeUnavailable(Exception):
+    pass
+
+class Membership():
+    """
+    Membership
+    ==========
+
+    parameters:
+        node_url (str):          URL at which this node can be reached by the other nodes
+        refresh_interval (int):  How often to send heartbeats and refresh the membership
+        replicas (int):          Number of points per node on the hash ring
+
+    Keeps a consistent hash ring of the manager nodes that have a current
+    heartbeat in Redis, always including this node. Nodes that fail to answer
+    a forwarded request are left out of the ring until their heartbeat has
+    had time to expire.
+    """
+    def __init__(self, node_url: str, refresh_interval: int = 5, replicas: int = 100):
+        self.node_url = node_url
+
+        self._refresh_interval = refresh_interval
+        self._replicas = replicas
+
+        self._live = {node_url}
+        self._suspects: Dict[str, float] = {}
+        self._ring = hashring.HashRing(self._live, replicas)
+        self._task: Optional[asyncio.Task] = None
+
+    @property
+    def nodes(self):
+        return self._ring.nodes
+
+    def owner(self, key: str)-> str:
+        """
+        Returns the URL of the node owning a key
+        """
+        return self._ring.node_for(key)
+
+    def mark_dead(self, node: str)-> None:
+        """
+        Leave a node out of the ring, failing over its keys to the other nodes
+        """
+        if node != self.node_url:
+            logger.warning(f"Removing unresponsive node {node} from the ring")
+            self._suspects[node] = asyncio.get_running_loop().time() + self._refresh_interval * 3
+            self._rebuild()
+
+    def start(self, get_locks: Callable[[], redis_locks.RedisLocks])-> None:
+        self._task = asyncio.create_task(self._refresh(get_locks))
+
+    async def leave(self, get_locks: Callable[[], redis_locks.RedisLocks])-> None:
+        if self._task is not None:
+            self._task.cancel()
+        locks = get_locks()
+        try:
+            await locks.remove_node(self.node_url)
+        finally:
+            await locks.close()
+
+    def _rebuild(self)-> None:
+        now = asyncio.get_running_loop().time()
+        self._suspects = {node: until for node, until in self._suspects.items() if until > now}
+
+        nodes = (self._live - set(self._suspects)) | {self.node_url}
+        if nodes != self._ring.nodes:
+            logger.info(f"Manager nodes: {sorted(nodes)}")
+            self._ring = hashring.HashRing(nodes, self._replicas)
+
+    async def _refresh(self, get_locks: Callable[[], redis_locks.RedisLocks])-> None:
+        locks = get_locks()
+        try:
+            while True:
+                try:
+                    await locks.announce_node(self.node_url, self._refresh_interval * 3)
+                    self._live = await locks.live_nodes()
+                    self._rebuild()
+                except Exception as e:
+                    logger.error(f"Failed to refresh node membership: {e}")
+                await asyncio.sleep(self._refresh_interval)
+        finally:
+            await locks.close()
+
+async def forward(
+        node: str,
+        path: str,
+        headers: Dict[str, str],
+        timeout: float,
+        params: Optional[List[Tuple[str, str]]] = None)-> Tuple[int, bytes, Dict[str, str]]:
+    """
+    Forward a job request, with headers and query parameters, to another
+    node, returning the status, content and relevant headers of its
+    response. Raises NodeUnavailable if the node cannot be reached or fails
+    to answer.
+    """
+    request_headers = {**headers, FORWARDED_HEADER: "1"}
+
+    try:
+        async with aiohttp.ClientSession(timeout = aiohttp.ClientTimeout(total = timeout)) as session:
+            async with session.get(f"{node}/job/{path}", headers = request_headers, params = params or []) as response:
+                content = await response.read()
+                return (response.status, content,
+                        {k: response.headers[k] for k in _RELAYED_RESPONSE_HEADERS if k in response.headers})
+    except (aiohttp.ClientError, asyncio.TimeoutError) as e:
+        raise NodeUnavailable(f"Could not forward to {node}: {e!r}") from e
@@ -1,4 +1,6 @@
-
+import os
+import socket
+import uuid
 from environs import Env
 
 env                    = Env()
@@ -7,17 +9,68 @@ env.read_env()
 REDIS_HOST             = env.str("REDIS_HOST", "jobman-redis")
 REDIS_PORT             = env.int("REDIS_PORT", 6379)
 REDIS_DB               = env.int("REDIS_DB", 0)
+REDIS_CLUSTER          = env.bool("REDIS_CLUSTER", False)
 REDIS_ERROR_KEY_PREFIX = env.str("REDIS_ERROR_SET_KEY", "jobman/errors:")
 REDIS_JOB_KEY_PREFIX   = env.str("REDIS_ERROR_SET_KEY", "jobman/jobs:")
+REDIS_JOURNAL_KEY      = env.str("REDIS_JOURNAL_KEY", "jobman/inflight")
+REDIS_WORKER_KEY_PREFIX= env.str("REDIS_WORKER_KEY_PREFIX", "jobman/workers:")
+REDIS_STATS_KEY        = env.str("REDIS_STATS_KEY", "jobman/stats")
+REDIS_ETAG_KEY_PREFIX  = env.str("REDIS_ETAG_KEY_PREFIX", "jobman/etags:")
+REDIS_INTEREST_KEY_PREFIX = env.str("REDIS_INTEREST_KEY_PREFIX", "jobman/interest:")
+REDIS_NODE_KEY_PREFIX  = env.str("REDIS_NODE_KEY_PREFIX", "jobman/nodes:")
 
 MAX_RETRIES            = env.int("MAX_RETRIES", 50)
 RETRY_SLEEP            = env.int("RETRY_SLEEP", 5)
 CHECK_ERRORS_EVERY     = env.int("CHECK_ERROR_DIVISOR", 5)
 
+PIPELINE_UPLOADS       = env.bool("PIPELINE_UPLOADS", False)
+MAX_INFLIGHT_UPLOADS   = env.int("MAX_INFLIGHT_UPLOADS", 2)
+
+STATS_SMOOTHING        = env.float("STATS_SMOOTHING", .2)
+DEFAULT_TASK_DURATION  = env.float("DEFAULT_TASK_DURATION", 5)
+
+RESULT_BUFFER_BYTES    = env.int("RESULT_BUFFER_BYTES", 64 * 1024 * 1024)
+RESULT_BUFFER_TTL      = env.float("RESULT_BUFFER_TTL", 60)
+
+CANCEL_ABANDONED       = env.bool("CANCEL_ABANDONED", True)
+INTEREST_WINDOW        = env.int("INTEREST_WINDOW", 60)
+
 MAX_TIMEOUT_RETRIES    = env.int("MAX_TIMEOUT_RETRIES", 50)
 TIMEOUT_COOLDOWN       = env.int("TIMEOUT_RETRY_SLEEP",7)
 
 DATA_CACHE_URL         = env.str("DATA_CACHE_URL", "http://data-cache")
 ROUTER_URL             = env.str("ROUTER_URL", "http://router")
 
+CACHE_GET_DEADLINE     = env.float("CACHE_GET_DEADLINE", 60)
+CACHE_HEAD_DEADLINE    = env.float("CACHE_HEAD_DEADLINE", 5)
+CACHE_SET_TIMEOUT      = env.float("CACHE_SET_TIMEOUT", 300)
+CACHE_HEDGE_QUANTILE   = env.float("CACHE_HEDGE_QUANTILE", .95)
+CACHE_BREAKER_THRESHOLD= env.int("CACHE_BREAKER_THRESHOLD", 5)
+CACHE_BREAKER_COOLDOWN = env.float("CACHE_BREAKER_COOLDOWN", 30)
+
+WORKER_ID              = env.str("WORKER_ID", f"{socket.gethostname()}-{os.getpid()}-{uuid.uuid4().hex[:8]}")
+DRAIN_TIMEOUT          = env.int("DRAIN_TIMEOUT", 20)
+HEARTBEAT_INTERVAL     = env.int("HEARTBEAT_INTERVAL", 10)
+
+ROUTING_ENABLED        = env.bool("ROUTING_ENABLED", False)
+ROUTING_MODE           = env.str("ROUTING_MODE", "forward")
+NODE_URL               = env.str("NODE_URL", f"http://{socket.gethostname()}")
+ROUTING_REFRESH_INTERVAL = env.int("ROUTING_REFRESH_INTERVAL", 5)
+FORWARD_TIMEOUT        = env.int("FORWARD_TIMEOUT", 30)
+
+ACCESS_LOG_PATH        = env.str("ACCESS_LOG_PATH", None)
+ACCESS_LOG_MAX_BYTES   = env.int("ACCESS_LOG_MAX_BYTES", 100 * 2**20)
+PREFETCH_ENABLED       = env.bool("PREFETCH_ENABLED", False)
+PREFETCH_IDLE_AFTER    = env.float("PREFETCH_IDLE_AFTER", 30)
+PREFETCH_MIN_SCORE     = env.float("PREFETCH_MIN_SCORE", 2)
+PREFETCH_HALF_LIFE     = env.float("PREFETCH_HALF_LIFE", 30 * 86400)
+
+TRACE_PATH             = env.str("TRACE_PATH", None)
+TRACE_SAMPLE_RATE      = env.float("TRACE_SAMPLE_RATE", 1)
+
+LOOP_MONITOR_INTERVAL  = env.float("LOOP_MONITOR_INTERVAL", .5)
+SLOW_CALLBACK_THRESHOLD= env.float("SLOW_CALLBACK_THRESHOLD", .25)
+DEBUG_TOKEN            = env.str("DEBUG_TOKEN", None)
+MAX_PROFILE_SECONDS    = env.int("MAX_PROFILE_SECONDS", 60)
+
 LOG_LEVEL              = env.str("LOG_LEVEL", "WARNING").upper()
@@ -0,0 +1,57 @@
+"""
+Simulate the job manager under a virtual clock.
+
+Examples:
+    python -m job_manager.simulation --requests 200 --rate 2 --retry-sleep 2
+    python -m job_manager.simulation --trace trace.jsonl --router-latency lognormal:0,.5
+"""
+import sys
+import json
+import time
+import random
+import argparse
+import logging
+import dataclasses
+from . import simulator, workload
+
+def main(argv = None):
+    defaults = simulator.Config()
+    parser = argparse.ArgumentParser(prog = "python -m job_manager.simulation", description = __doc__,
+            formatter_class = argparse.RawDescriptionHelpFormatter)
+
+    parser.add_argument("--verbose", action = "store_true", help = "Show the job manager's logs")
+
+    source = parser.add_argument_group("workload")
+    source.add_argument("--trace", type = argparse.FileType("r"), help = "JSONL trace with ts and path keys")
+    source.add_argument("--chain", action = "append", dest = "chains", help = "Chain to request (repeatable)")
+    source.add_argument("--requests", type = int, default = 100, help = "Number of synthetic requests")
+    source.add_argument("--rate", type = float, default = 1, help = "Synthetic requests per second")
+
+    config = parser.add_argument_group("config")
+    for field in dataclasses.fields(simulator.Config):
+        flag = "--" + field.name.replace("_", "-")
+        if field.type is bool:
+            config.add_argument(flag, action = "store_true", default = getattr(defaults, field.name))
+            config.add_argument("--no-" + flag[2:], dest = field.name, action = "store_false")
+        else:
+            config.add_argument(flag, type = field.type, default = getattr(defaults, field.name))
+
+    args = parser.parse_args(argv)
+    logging.basicConfig(level = logging.INFO if args.verbose else logging.CRITICAL + 1)
+    sim_config = simulator.Config(**{f.name: getattr(args, f.name) for f in dataclasses.fields(simulator.Config)})
+
+    if args.trace is not None:
+        requests = workload.recorded(args.trace)
+    else:
+        chains = args.chains or workload.example_chains()
+        requests = workload.synthetic(chains, args.requests, args.rate, random.Random(sim_config.seed))
+
+    started = time.time()
+    report = simulator.Simulation(sim_config).run(requests)
+    report["wall_time"] = time.time() - started
+
+    json.dump(report, sys.stdout, indent = 2)
+    print()
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,56 @@
+import asyncio
+import selectors
+from typing import Awaitable, TypeVar, Optional
+
+T = TypeVar("T")
+
+class Deadlock(Exception):
+    pass
+
+class _VirtualSelector(selectors.SelectSelector):
+    """
+    A selector that never waits for IO: waiting for a timeout instead moves
+    the loop's virtual clock forward.
+    """
+    def __init__(self):
+        super().__init__()
+        self.loop: Optional["VirtualEventLoop"] = None
+
+    def select(self, timeout = None):
+        if timeout is None:
+            raise Deadlock("Nothing is scheduled, and there is no IO to wait for")
+        if timeout > 0:
+            self.loop.advance(timeout)
+        return []
+
+class VirtualEventLoop(asyncio.SelectorEventLoop):
+    """
+    VirtualEventLoop
+    ================
+
+    An event loop running on a virtual clock, which jumps straight to the
+    next scheduled callback whenever nothing is ready to run. Sleeps and
+    timeouts therefore take no real time, and runs are deterministic as long
+    as the code under test does no real IO.
+    """
+    def __init__(self):
+        selector = _VirtualSelector()
+        super().__init__(selector)
+        selector.loop = self
+        self._now = 0.0
+
+    def time(self)-> float:
+        return self._now
+
+    def advance(self, seconds: float)-> None:
+        self._now += seconds
+
+def run(main: Awaitable[T])-> T:
+    """
+    Run a coroutine to completion on a fresh VirtualEventLoop
+    """
+    loop = VirtualEventLoop()
+    try:
+        return loop.run_until_complete(main)
+    finally:
+        loop.close()
@@ -0,0 +1,199 @@
+"""
+In-memory fakes of the router, the data cache and Redis, for running the real
+JobHandler and RedisLocks logic under a virtual clock.
+"""
+import json
+import asyncio
+import fnmatch
+import random
+import dataclasses
+from typing import Callable, Dict, Optional, Tuple, Union, List, AsyncIterator
+from collections import Counter
+from .. import caching, redis_locks, stats
+
+Distribution = Callable[[], float]
+
+def distribution(spec: str, rng: random.Random)-> Distribution:
+    """
+    Returns a sampler from a spec such as "const:1", "uniform:.5,1.5",
+    "exp:2" (mean) or "lognormal:0,.5" (mu, sigma).
+    """
+    kind, _, raw_args = spec.partition(":")
+    args = [float(a) for a in raw_args.split(",") if a]
+
+    try:
+        samplers = {
+                "const":     lambda: args[0],
+                "uniform":   lambda: rng.uniform(args[0], args[1]),
+                "exp":       lambda: rng.expovariate(1 / args[0]),
+                "lognormal": lambda: rng.lognormvariate(args[0], args[1]),
+            }
+        sampler = samplers[kind]
+        sampler()
+    except (KeyError, IndexError) as e:
+        raise ValueError(f"Bad distribution spec: {spec}") from e
+
+    return sampler
+
+def _encode(value: Union[str, bytes, int, float])-> bytes:
+    return value if isinstance(value, bytes) else str(value).encode()
+
+class FakeRedis:
+    """
+    Implements the subset of the aioredis client used by RedisLocks, with key
+    expiry following the running loop's clock. The scripts used by RedisLocks
+    are run as Python equivalents.
+    """
+    def __init__(self, latency: Distribution = lambda: 0):
+        self._latency = latency
+        self._values: Dict[str, bytes] = {}
+        self._hashes: Dict[str, Dict[str, bytes]] = {}
+        self._expires: Dict[str, float] = {}
+        self.operations = 0
+
+        self._scripts = {
+                redis_locks.RECORD_TASK_SCRIPT: self._record_task,
+            }
+
+    async def _op(self):
+        self.operations += 1
+        await asyncio.sleep(self._latency())
+        now = asyncio.get_running_loop().time()
+        for key in [k for k, at in self._expires.items() if at <= now]:
+            self._values.pop(key, None)
+            del self._expires[key]
+
+    async def set(self, key: str, value, nx: bool = False, xx: bool = False, ex: Optional[int] = None, keepttl: bool = False):
+        await self._op()
+        if (nx and key in self._values) or (xx and key not in self._values):
+            return None
+        self._values[key] = _encode(value)
+        if ex is not None:
+            self._expires[key] = asyncio.get_running_loop().time() + ex
+        elif not keepttl:
+            self._expires.pop(key, None)
+        return True
+
+    async def get(self, key: str)-> Optional[bytes]:
+        await self._op()
+        return self._values.get(key)
+
+    async def delete(self, *keys: str)-> int:
+        await self._op()
+        deleted = 0
+        for key in keys:
+            deleted += int(self._values.pop(key, None) is not None or self._hashes.pop(key, None) is not None)
+            self._expires.pop(key, None)
+        return deleted
+
+    async def scan_iter(self, match: str)-> AsyncIterator[bytes]:
+        await self._op()
+        for key in [k for k in [*self._values, *self._hashes] if fnmatch.fnmatchcase(k, match)]:
+            yield key.encode()
+
+    async def hset(self, name: str, key: str, value)-> int:
+        await self._op()
+        is_new = key not in self._hashes.setdefault(name, {})
+        self._hashes[name][key] = _encode(value)
+        return int(is_new)
+
+    async def hget(self, name: str, key: str)-> Optional[bytes]:
+        await self._op()
+        return self._hashes.get(name, {}).get(key)
+
+    async def hmget(self, name: str, keys: List[str])-> List[Optional[bytes]]:
+        await self._op()
+        return [self._hashes.get(name, {}).get(k) for k in keys]
+
+    async def hdel(self, name: str, *keys: str)-> int:
+        await self._op()
+        return sum(self._hashes.get(name, {}).pop(k, None) is not None for k in keys)
+
+    async def hgetall(self, name: str)-> Dict[bytes, bytes]:
+        await self._op()
+        return {k.encode(): v for k, v in self._hashes.get(name, {}).items()}
+
+    async def eval(self, script: str, numkeys: int, *keys_and_args):
+        await self._op()
+        return self._scripts[script](list(keys_and_args[:numkeys]), list(keys_and_args[numkeys:]))
+
+    def _record_task(self, keys: List[str], args: list):
+        task, duration, size, alpha = args
+        raw_stats = self._hashes.get(keys[0], {}).get(task)
+        current = stats.TaskStats(**json.loads(raw_stats)) if raw_stats else stats.TaskStats()
+        updated = current.update(float(duration), int(size), float(alpha))
+        self._hashes.setdefault(keys[0], {})[task] = json.dumps(dataclasses.asdict(updated)).encode()
+
+    async def close(self):
+        pass
+
+    def locks(self, owner: str = "anonymous")-> redis_locks.RedisLocks:
+        """
+        Returns a RedisLocks client using this fake
+        """
+        return redis_locks.RedisLocks("fake", 0, 0, owner = owner, connection = self)
+
+class FakeApi:
+    """
+    A router whose jobs take a sampled amount of time, and fail or time out
+    at configurable rates.
+    """
+    def __init__(self,
+            latency: Distribution,
+            rng: random.Random,
+            failure_rate: float = 0,
+            timeout_rate: float = 0,
+            size: int = 1024):
+        self._latency = latency
+        self._rng = rng
+        self._failure_rate = failure_rate
+        self._timeout_rate = timeout_rate
+        self._size = size
+        self.calls: Counter = Counter()
+
+    async def touch(self, path: str)-> Tuple[int, bytes]:
+        self.calls[path] += 1
+        await asyncio.sleep(self._latency())
+
+        outcome = self._rng.random()
+        if outcome < self._timeout_rate:
+            raise asyncio.exceptions.TimeoutError
+        if outcome < self._timeout_rate + self._failure_rate:
+            return 500, b"Simulated failure"
+        return 200, b"a" * self._size
+
+class FakeCache:
+    """
+    A data cache where each request takes a sampled amount of time.
+    """
+    def __init__(self, latency: Distribution):
+        self._latency = latency
+        self._content: Dict[str, bytes] = {}
+        self.heads = 0
+        self.head_misses = 0
+        self.gets = 0
+        self.sets = 0
+
+    async def set(self, key: str, content: bytes):
+        await asyncio.sleep(self._latency())
+        self.sets += 1
+        self._content[key] = content
+
+    async def fetch(self, key: str, byte_range: Optional[str] = None)-> caching.Cached:
+        await asyncio.sleep(self._latency())
+        self.gets += 1
+        try:
+            return caching.Cached(self._content[key])
+        except KeyError:
+            raise caching.NotCached
+
+    async def get(self, key: str)-> bytes:
+        return (await self.fetch(key)).content
+
+    async def exists(self, key: str)-> bool:
+        await asyncio.sleep(self._latency())
+        self.heads += 1
+        if (found := key in self._content):
+            return found
+        self.head_misses += 1
+        return found
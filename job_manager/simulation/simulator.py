@@ -0,0 +1,160 @@
+import asyncio
+import random
+import statistics
+from typing import List, Dict, Any, Set
+from dataclasses import dataclass, field
+from .. import job_handler, redis_locks, parse, caching
+from . import fakes, clock, workload
+
+@dataclass
+class Config:
+    """
+    Parameters of a simulation run. The scheduling parameters mirror the
+    settings of the same name.
+    """
+    retry_sleep: int = 5
+    max_retries: int = 50
+    check_errors_every: int = 5
+    max_timeout_retries: int = 50
+    timeout_cooldown: int = 7
+    pipeline_uploads: bool = False
+    cancel_abandoned: bool = True
+    interest_window: int = 60
+
+    router_latency: str = "const:1"
+    cache_latency: str = "const:.05"
+    redis_latency: str = "const:.001"
+    failure_rate: float = 0
+    timeout_rate: float = 0
+    artifact_size: int = 1024
+
+    client_poll: float = 5
+    client_timeout: float = 600
+    abandon_rate: float = 0
+    seed: int = 0
+
+@dataclass
+class _Outcomes:
+    latencies: List[float] = field(default_factory = list)
+    failed: int = 0
+    gave_up: int = 0
+    abandoned: int = 0
+    polls: int = 0
+
+class Simulation:
+    """
+    Simulation
+    ==========
+
+    parameters:
+        config (Config): Parameters of the run
+
+    Runs the real JobHandler and RedisLocks against fakes of the router,
+    cache and Redis. Each simulated client behaves like a caller of
+    /job/{path}: it checks errors and the cache, dispatches the chain if it
+    is not cached and polls until it is.
+    """
+    def __init__(self, config: Config):
+        self._config = config
+        rng = random.Random(config.seed)
+        self._rng = random.Random(config.seed + 1)
+
+        self.api = fakes.FakeApi(fakes.distribution(config.router_latency, rng), rng,
+                config.failure_rate, config.timeout_rate, config.artifact_size)
+        self.cache = fakes.FakeCache(fakes.distribution(config.cache_latency, rng))
+        self.redis = fakes.FakeRedis(fakes.distribution(config.redis_latency, rng))
+
+        self._outcomes = _Outcomes()
+        self._handlers: Set[asyncio.Task] = set()
+
+    def run(self, requests: workload.Workload)-> Dict[str, Any]:
+        """
+        run
+        ===
+
+        parameters:
+            requests (workload.Workload): Arrival times and paths of requests
+
+        returns:
+            Dict[str, Any]: Report of latencies and amount of work done
+        """
+        return clock.run(self._run(requests))
+
+    def _locks(self)-> redis_locks.RedisLocks:
+        return self.redis.locks("simulation")
+
+    async def _dispatch(self, jobs: List[str]):
+        handler = job_handler.JobHandler(self.api, self.cache, self._locks(),
+                self._config.retry_sleep, self._config.max_retries, self._config.check_errors_every,
+                self._config.pipeline_uploads, cancel_abandoned = self._config.cancel_abandoned)
+        await handler.handle_chain(jobs)
+
+    async def _client(self, arrival: float, path: str):
+        loop = asyncio.get_running_loop()
+        await asyncio.sleep(arrival - loop.time())
+        started = loop.time()
+        jobs = parse.subjobs(path)
+        locks = self._locks()
+        abandons = self._rng.random() < self._config.abandon_rate
+
+        while loop.time() - started < self._config.client_timeout:
+            for job in jobs:
+                if await locks.retry_error(job, self._config.max_timeout_retries, self._config.timeout_cooldown) is not None:
+                    self._outcomes.failed += 1
+                    return
+
+            try:
+                await self.cache.get(jobs[-1])
+            except caching.NotCached:
+                await locks.register_interest(jobs[-1], self._config.interest_window)
+                task = asyncio.create_task(self._dispatch(jobs))
+                self._handlers.add(task)
+                task.add_done_callback(self._handlers.discard)
+            else:
+                self._outcomes.latencies.append(loop.time() - started)
+                return
+
+            if abandons:
+                self._outcomes.abandoned += 1
+                return
+
+            self._outcomes.polls += 1
+            await asyncio.sleep(self._config.client_poll)
+
+        self._outcomes.gave_up += 1
+
+    async def _run(self, requests: workload.Workload)-> Dict[str, Any]:
+        loop = asyncio.get_running_loop()
+        await asyncio.gather(*[self._client(at, path) for at, path in requests])
+        clients_done = loop.time()
+        while self._handlers:
+            await asyncio.gather(*self._handlers, return_exceptions = True)
+
+        return self._report(len(requests), clients_done, loop.time())
+
+    def _report(self, n_requests: int, clients_done: float, handlers_done: float)-> Dict[str, Any]:
+        latencies = sorted(self._outcomes.latencies)
+        quantile = lambda q: latencies[min(len(latencies) - 1, int(q * len(latencies)))] if latencies else None
+        upstream_calls = sum(self.api.calls.values())
+
+        return {
+                "requests":           n_requests,
+                "completed":          len(latencies),
+                "failed":             self._outcomes.failed,
+                "gave_up":            self._outcomes.gave_up,
+                "abandoned":          self._outcomes.abandoned,
+                "latency": {
+                    "mean": statistics.mean(latencies) if latencies else None,
+                    "p50":  quantile(.5),
+                    "p90":  quantile(.9),
+                    "p99":  quantile(.99),
+                    "max":  latencies[-1] if latencies else None,
+                    },
+                "upstream_calls":     upstream_calls,
+                "upstream_duplicates":upstream_calls - len(self.api.calls),
+                "client_polls":       self._outcomes.polls,
+                "cache_heads":        self.cache.heads,
+                "wasted_cache_heads": self.cache.head_misses,
+                "redis_operations":   self.redis.operations,
+                "virtual_time":       {"clients": clients_done, "handlers": handlers_done},
+            }
@@ -0,0 +1,39 @@
+import json
+import random
+from typing import List, Tuple, Iterable
+
+Workload = List[Tuple[float, str]]
+
+def synthetic(chains: List[str], n_requests: int, rate: float, rng: random.Random)-> Workload:
+    """
+    Returns a workload of n_requests for randomly chosen chains, with
+    exponentially distributed gaps averaging rate requests per second.
+    """
+    workload: Workload = []
+    at = 0.0
+    for _ in range(n_requests):
+        workload.append((at, rng.choice(chains)))
+        at += rng.expovariate(rate)
+    return workload
+
+def recorded(lines: Iterable[str])-> Workload:
+    """
+    Returns a workload from JSONL lines with "ts" (seconds) and "path" keys,
+    with times made relative to the first request.
+    """
+    entries = [json.loads(line) for line in lines if line.strip()]
+    entries = [(float(e["ts"]), e["path"]) for e in entries]
+    entries.sort()
+
+    if not entries:
+        return []
+
+    start = entries[0][0]
+    return [(ts - start, path) for ts, path in entries]
+
+def example_chains()-> List[str]:
+    """
+    The chains requested by the integration test
+    """
+    as_path = lambda steps: "f/" + "/".join(["/".join([s]*3) for s in steps])
+    return [as_path("ab"), as_path("abc"), as_path("abcdefg")]
@@ -0,0 +1,62 @@
+import math
+from typing import Dict, List, Optional
+from dataclasses import dataclass, asdict
+from . import parse
+
+# z-score of the 90th percentile of a normal distribution
+Z_90 = 1.2816
+
+@dataclass
+class TaskStats:
+    """
+    Exponentially weighted aggregates of the duration (seconds) and artifact
+    size (bytes) of a task.
+    """
+    count: int = 0
+    mean_duration: float = 0.0
+    var_duration: float = 0.0
+    mean_size: float = 0.0
+
+    def update(self, duration: float, size: int, alpha: float = .2)-> "TaskStats":
+        """
+        Returns the aggregate with a new observation folded in
+        """
+        if self.count == 0:
+            return TaskStats(1, duration, 0.0, float(size))
+
+        diff = duration - self.mean_duration
+        increment = alpha * diff
+        return TaskStats(
+                count = self.count + 1,
+                mean_duration = self.mean_duration + increment,
+                var_duration = (1 - alpha) * (self.var_duration + diff * increment),
+                mean_size = self.mean_size + alpha * (size - self.mean_size))
+
+    @property
+    def p90_duration(self)-> float:
+        return self.mean_duration + Z_90 * math.sqrt(self.var_duration)
+
+    def dict(self)-> Dict[str, float]:
+        return {**asdict(self), "p90_duration": self.p90_duration}
+
+def task_key(task: parse.Task)-> str:
+    return f"{task.namespace}/{task.name}"
+
+def job_task_key(job: str)-> str:
+    """
+    Returns the stats key of the task computed by a (sub)job, which is the
+    first task in its path.
+    """
+    _, tasks = parse.parse_path(job)
+    return task_key(tasks[0])
+
+def eta(remaining: List[str], stats: Dict[str, Optional[TaskStats]], default: float)-> float:
+    """
+    Returns the expected time needed to compute a list of jobs, using default
+    for tasks that have no recorded history.
+    """
+    total = 0.0
+    for job in remaining:
+        task_stats = stats.get(job_task_key(job))
+        total += task_stats.mean_duration if task_stats is not None and task_stats.count > 0 else default
+    return total
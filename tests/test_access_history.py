@@ -0,0 +1,53 @@
+
+import os
+import tempfile
+from unittest import TestCase
+from job_manager import access_history
+
+class TestAccessHistory(TestCase):
+    def test_log_roundtrip(self):
+        with tempfile.TemporaryDirectory() as folder:
+            path = os.path.join(folder, "access.jsonl")
+            log = access_history.AccessLog(path)
+            log.write({"ts": 1, "path": "foo/a/b/c"})
+            log.write({"ts": 2, "path": "foo/1/2/3/a/b/c"})
+            log.close()
+
+            with open(path, "a") as f:
+                f.write("not json\n")
+
+            self.assertEqual([e["ts"] for e in access_history.read(path)], [1, 2])
+            self.assertEqual([e["ts"] for e in access_history.read(path, since = 2)], [2])
+
+    def test_log_rotation(self):
+        with tempfile.TemporaryDirectory() as folder:
+            path = os.path.join(folder, "access.jsonl")
+            log = access_history.AccessLog(path, max_bytes = 100)
+            for ts in range(20):
+                log.write({"ts": ts, "path": "foo/a/b/c"})
+            log.close()
+
+            # The last write may have rotated the log
+            self.assertLess(os.path.getsize(path) if os.path.exists(path) else 0, 100)
+            self.assertLess(os.path.getsize(path + ".1"), 150)
+
+            timestamps = [e["ts"] for e in access_history.read(path)]
+            self.assertEqual(timestamps, list(range(20 - len(timestamps), 20)))
+            self.assertGreater(len(timestamps), 2)
+
+    def test_learn(self):
+        day = 86400
+        entries = [
+                {"ts": 0,           "path": "foo/a/b/c"},
+                {"ts": 60,          "path": "foo/1/2/3/a/b/c"},
+                {"ts": 30 * day,    "path": "foo/a/b/c"},
+                {"ts": 30 * day+60, "path": "foo/1/2/3/a/b/c"},
+                {"ts": 30 * day,    "path": "bar/x/y/z"},
+            ]
+        history = access_history.History(half_life = 30 * day).learn(entries, now = 30 * day)
+
+        self.assertAlmostEqual(history.scores["foo/a/b/c"], 1.5)
+        self.assertCountEqual(history.frequent(1.2), ["foo/a/b/c", "foo/1/2/3/a/b/c"])
+        self.assertEqual(history.frequent(0, limit = 1), ["foo/1/2/3/a/b/c"])
+        self.assertEqual(history.successors_of("foo/a/b/c", 2), ["foo/1/2/3/a/b/c"])
+        self.assertEqual(history.successors_of("bar/x/y/z", 1), [])
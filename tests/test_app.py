@@ -0,0 +1,143 @@
+
+import re
+import asyncio
+from unittest import TestCase, mock
+from fastapi.testclient import TestClient
+from job_manager import app, caching, parse, routing
+from job_manager.simulation import fakes
+
+PATH = "f/a/a/a/b/b/b"
+JOB = parse.subjobs(PATH)[-1]
+CONTENT = b"0123456789"
+OWNER = "http://owner"
+
+class RangeCache(fakes.FakeCache):
+    """
+    A cache answering Range requests of the form bytes=start-end
+    """
+    async def fetch(self, key: str, byte_range = None)-> caching.Cached:
+        cached = await super().fetch(key)
+        if byte_range is None:
+            return cached
+        start, end = (int(b) for b in re.fullmatch(r"bytes=(\d+)-(\d+)", byte_range).groups())
+        return caching.Cached(cached.content[start:end + 1], 206, f"bytes {start}-{end}/{len(cached.content)}")
+
+class UnavailableCache(fakes.FakeCache):
+    async def fetch(self, key: str, byte_range = None)-> caching.Cached:
+        raise caching.CacheUnavailable("Circuit open")
+
+class AppTestCase(TestCase):
+    def setUp(self):
+        self.redis = fakes.FakeRedis()
+        self.cache = RangeCache(lambda: 0)
+        self.client = TestClient(app.app)
+
+        app.app.dependency_overrides[app.with_locks_client] = lambda: self.redis.locks()
+        app.app.dependency_overrides[app.with_rest_cache] = lambda: self.cache
+
+    def tearDown(self):
+        app.app.dependency_overrides = {}
+
+    def cache_job(self, etag = None):
+        asyncio.run(self.cache.set(JOB, CONTENT))
+        if etag is not None:
+            asyncio.run(self.redis.locks().set_etag(JOB, etag))
+
+class TestGetJob(AppTestCase):
+    def test_not_modified_without_download(self):
+        etag = caching.content_etag(CONTENT)
+        self.cache_job(etag)
+
+        response = self.client.get(f"/job/{PATH}", headers = {"If-None-Match": etag})
+
+        self.assertEqual(response.status_code, 304)
+        self.assertEqual(response.headers["ETag"], etag)
+        self.assertEqual(self.cache.gets, 0)
+
+    def test_etag_stored_on_first_read(self):
+        self.cache_job()
+
+        response = self.client.get(f"/job/{PATH}")
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.content, CONTENT)
+        self.assertEqual(response.headers["ETag"], caching.content_etag(CONTENT))
+
+        response = self.client.get(f"/job/{PATH}", headers = {"If-None-Match": response.headers["ETag"]})
+        self.assertEqual(response.status_code, 304)
+
+    def test_relays_range(self):
+        self.cache_job(caching.content_etag(CONTENT))
+
+        response = self.client.get(f"/job/{PATH}", headers = {"Range": "bytes=2-5"})
+
+        self.assertEqual(response.status_code, 206)
+        self.assertEqual(response.content, b"2345")
+        self.assertEqual(response.headers["Content-Range"], "bytes 2-5/10")
+        self.assertEqual(response.headers["ETag"], caching.content_etag(CONTENT))
+
+    def test_cache_unavailable(self):
+        self.cache = UnavailableCache(lambda: 0)
+
+        response = self.client.get(f"/job/{PATH}")
+
+        self.assertEqual(response.status_code, 503)
+        self.assertIn("Retry-After", response.headers)
+
+class TestRouting(AppTestCase):
+    def setUp(self):
+        super().setUp()
+        self.forwarded = []
+        self.forward_error = None
+
+        for patch in [
+                mock.patch.object(app.settings, "ROUTING_ENABLED", True),
+                mock.patch.object(app.settings, "ROUTING_MODE", "forward"),
+                mock.patch.object(app.membership, "owner", lambda key: OWNER),
+                mock.patch.object(app.routing, "forward", self.forward)]:
+            patch.start()
+            self.addCleanup(patch.stop)
+
+    async def forward(self, node, path, headers, timeout, params = None):
+        self.forwarded.append((node, path, headers, params))
+        if self.forward_error is not None:
+            raise self.forward_error
+        return 200, b"remote", {"ETag": '"remote"'}
+
+    def test_forwards_to_owner(self):
+        response = self.client.get(f"/job/{PATH}?q=1", headers = {"Range": "bytes=2-5"})
+
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.content, b"remote")
+        self.assertEqual(response.headers["ETag"], '"remote"')
+        self.assertEqual(self.forwarded, [(OWNER, PATH, {"Range": "bytes=2-5"}, [("q", "1")])])
+
+    def test_redirects_to_owner(self):
+        with mock.patch.object(app.settings, "ROUTING_MODE", "redirect"):
+            response = self.client.get(f"/job/{PATH}?q=1&q=2", allow_redirects = False)
+
+        self.assertEqual(response.status_code, 307)
+        self.assertEqual(response.headers["Location"], f"{OWNER}/job/{PATH}?q=1&q=2&{routing.REDIRECTED_PARAM}=1")
+        self.assertEqual(self.forwarded, [])
+
+    def test_serves_locally_when_owner_unreachable(self):
+        self.cache_job()
+        self.forward_error = routing.NodeUnavailable("Connection refused")
+
+        with mock.patch.object(app.membership, "mark_dead") as mark_dead:
+            response = self.client.get(f"/job/{PATH}")
+
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.content, CONTENT)
+        self.assertEqual(len(self.forwarded), 1)
+        mark_dead.assert_called_once_with(OWNER)
+
+    def test_does_not_forward_forwarded_requests(self):
+        self.cache_job()
+
+        forwarded = self.client.get(f"/job/{PATH}", headers = {routing.FORWARDED_HEADER: "1"})
+        redirected = self.client.get(f"/job/{PATH}?{routing.REDIRECTED_PARAM}=1")
+
+        for response in [forwarded, redirected]:
+            self.assertEqual(response.status_code, 200)
+            self.assertEqual(response.content, CONTENT)
+        self.assertEqual(self.forwarded, [])
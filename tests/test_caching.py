@@ -0,0 +1,25 @@
+
+from unittest import TestCase
+from job_manager import caching
+
+class TestETags(TestCase):
+    def test_content_etag(self):
+        etag = caching.content_etag(b"foo")
+        self.assertEqual(etag, '"0beec7b5ea3f0fdbc95d0dd47f3c5bc275da8a33"')
+        self.assertEqual(etag, caching.content_etag(b"foo"))
+        self.assertNotEqual(etag, caching.content_etag(b"bar"))
+
+    def test_etag_matches(self):
+        etag = '"abc"'
+        self.assertTrue(caching.etag_matches('"abc"', etag))
+        self.assertTrue(caching.etag_matches('*', etag))
+        self.assertTrue(caching.etag_matches(' * ', etag))
+        self.assertTrue(caching.etag_matches('"xyz", "abc"', etag))
+        self.assertTrue(caching.etag_matches('"xyz",W/"abc"', etag))
+        self.assertTrue(caching.etag_matches('"abc"', 'W/"abc"'))
+
+        self.assertFalse(caching.etag_matches('"xyz"', etag))
+        self.assertFalse(caching.etag_matches('"xyz", "abcd"', etag))
+        self.assertFalse(caching.etag_matches('abc', etag))
+        self.assertFalse(caching.etag_matches(None, etag))
+        self.assertFalse(caching.etag_matches('*', None))
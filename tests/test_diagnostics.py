@@ -0,0 +1,47 @@
+
+import time
+import marshal
+import asyncio
+from unittest import TestCase
+from job_manager import diagnostics
+
+class TestDiagnostics(TestCase):
+    def test_loop_monitor(self):
+        monitor = diagnostics.LoopMonitor(interval = .01, slow_threshold = .05)
+
+        async def main():
+            monitor.start()
+            await asyncio.sleep(.05)
+            time.sleep(.2)
+            await asyncio.sleep(.05)
+            monitor.stop()
+
+        with self.assertLogs(diagnostics.logger, "WARNING") as logs:
+            asyncio.run(main())
+
+        self.assertIn("test_diagnostics.py", logs.output[0])
+        self.assertGreater(monitor.lag()["max"], .15)
+
+    def test_block_shorter_than_sampling_interval(self):
+        monitor = diagnostics.LoopMonitor(interval = .5, slow_threshold = .25)
+
+        async def main():
+            monitor.start()
+            await asyncio.sleep(.5)
+            time.sleep(.6)
+            await asyncio.sleep(.05)
+            monitor.stop()
+
+        with self.assertLogs(diagnostics.logger, "WARNING") as logs:
+            asyncio.run(main())
+
+        self.assertIn("test_diagnostics.py", logs.output[0])
+        self.assertIn("was blocked for", logs.output[1])
+
+    def test_profile(self):
+        async def main():
+            return await asyncio.gather(diagnostics.profile(.05), diagnostics.profile(.05), return_exceptions = True)
+
+        profile, busy = asyncio.run(main())
+        self.assertIsInstance(marshal.loads(profile), dict)
+        self.assertIsInstance(busy, diagnostics.ProfilerBusy)
@@ -0,0 +1,24 @@
+
+from unittest import TestCase
+from job_manager.hashring import HashRing
+
+class TestHashRing(TestCase):
+    def test_ownership(self):
+        keys = [f"pgm/ns/task/{i}" for i in range(1000)]
+        ring = HashRing(["http://a", "http://b", "http://c"])
+        owners = {key: ring.node_for(key) for key in keys}
+
+        self.assertEqual(set(owners.values()), ring.nodes)
+        self.assertEqual(owners, {key: HashRing(["http://c", "http://a", "http://b"]).node_for(key) for key in keys})
+
+    def test_removal_moves_only_removed_keys(self):
+        keys = [f"pgm/ns/task/{i}" for i in range(1000)]
+        before = HashRing(["http://a", "http://b", "http://c"])
+        after = HashRing(["http://a", "http://b"])
+
+        for key in keys:
+            if before.node_for(key) != "http://c":
+                self.assertEqual(before.node_for(key), after.node_for(key))
+
+    def test_empty(self):
+        self.assertRaises(LookupError, HashRing([]).node_for, "foo")
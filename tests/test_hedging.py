@@ -0,0 +1,88 @@
+
+import asyncio
+from unittest import TestCase
+from job_manager import hedging
+from job_manager.simulation import clock
+
+class TestHedging(TestCase):
+    def test_hedged(self):
+        latencies = [10, 1]
+
+        async def request():
+            latency = latencies.pop(0)
+            await asyncio.sleep(latency)
+            return latency
+
+        async def main():
+            result = await hedging.hedged(request, 2)
+            return result, asyncio.get_running_loop().time()
+
+        self.assertEqual(clock.run(main()), ((1, True, True), 3))
+
+    def test_guard(self):
+        guard = hedging.Guard({"get": 5}, min_samples = 3, breaker = hedging.CircuitBreaker(2, 60))
+        latencies = [1, 1, 1, 10, 1, 10, 10, 10, 10]
+
+        async def request():
+            await asyncio.sleep(latencies.pop(0))
+            return "ok"
+
+        async def main():
+            for _ in range(4):
+                await guard.call("get", request)
+            for _ in range(2):
+                try:
+                    await guard.call("get", request)
+                except asyncio.TimeoutError:
+                    pass
+            return await guard.call("get", request)
+
+        with self.assertLogs(hedging.logger, "WARNING"):
+            self.assertRaises(hedging.CircuitOpen, clock.run, main())
+
+        metrics = guard.metrics()
+        self.assertEqual(metrics["breaker"], "open")
+        self.assertEqual(metrics["operations"]["get"]["hedge_wins"], 1)
+        self.assertEqual(metrics["operations"]["get"]["timeouts"], 2)
+        self.assertEqual(metrics["operations"]["get"]["rejected"], 1)
+
+    def test_records_primary_latency(self):
+        guard = hedging.Guard({"get": 60}, hedge_quantile = .5, min_samples = 3)
+        latencies = [4, 4, 4, 8, 1, 8, 1]
+        completed = []
+
+        async def request():
+            latency = latencies.pop(0)
+            await asyncio.sleep(latency)
+            completed.append(latency)
+            return "ok"
+
+        async def main():
+            results = [await guard.call("get", request) for _ in range(5)]
+            await asyncio.sleep(10)
+            return results
+
+        self.assertEqual(clock.run(main()), ["ok"] * 5)
+
+        # Hedges won after 5s, and the primaries they raced were cancelled then
+        metrics = guard.metrics()["operations"]["get"]
+        self.assertEqual(metrics["hedge_wins"], 2)
+        self.assertEqual(completed, [4, 4, 4, 1, 1])
+        # Recorded latencies are [4, 4, 4, 5, 5]
+        self.assertEqual(metrics["p50"], 4)
+        self.assertEqual(metrics["p95"], 5)
+
+    def test_expected_outcomes(self):
+        class Missing(Exception):
+            pass
+
+        guard = hedging.Guard({"head": 5})
+
+        async def request():
+            raise Missing
+
+        async def main():
+            await guard.call("head", request, expected = (Missing,))
+
+        self.assertRaises(Missing, clock.run, main())
+        self.assertEqual(guard.breaker.state, "closed")
@@ -0,0 +1,217 @@
+
+import random
+import asyncio
+from unittest import TestCase
+from job_manager import caching, job_handler, parse, redis_locks, result_buffer, stats
+from job_manager.simulation import clock, fakes
+
+CHAIN = parse.subjobs("f/a/a/a/b/b/b/c/c/c/d/d/d")
+
+class SlowUploads(fakes.FakeCache):
+    """
+    A cache where uploads take a while, and fail for some keys
+    """
+    def __init__(self, upload_time: float, failing = ()):
+        super().__init__(lambda: 0)
+        self._upload_time = upload_time
+        self._failing = set(failing)
+        self.inflight = 0
+        self.max_inflight = 0
+
+    async def set(self, key: str, content: bytes):
+        self.inflight += 1
+        self.max_inflight = max(self.max_inflight, self.inflight)
+        try:
+            await asyncio.sleep(self._upload_time)
+            if key in self._failing:
+                raise ValueError("Remote returned 500")
+            self._content[key] = content
+        finally:
+            self.inflight -= 1
+
+class TestPipelinedUploads(TestCase):
+    def setUp(self):
+        self.redis = fakes.FakeRedis()
+        self.api = fakes.FakeApi(lambda: 1, random.Random(0))
+
+    def handle(self, cache: fakes.FakeCache, locks: redis_locks.RedisLocks, results = None):
+        handler = job_handler.JobHandler(self.api, cache, locks,
+                pipeline_uploads = True, max_inflight_uploads = 2, results = results)
+        return handler.handle_chain(CHAIN)
+
+    def test_inflight_bound(self):
+        cache = SlowUploads(upload_time = 5)
+        clock.run(self.handle(cache, self.redis.locks()))
+
+        self.assertEqual(cache.max_inflight, 2)
+        self.assertEqual(set(cache._content), set(CHAIN))
+
+    def test_uploads_finish_before_cleanup(self):
+        cache = SlowUploads(upload_time = 5)
+        locks = self.redis.locks()
+        cached_at_cleanup = []
+
+        cleanup = locks.cleanup
+        async def recording_cleanup():
+            cached_at_cleanup.append(set(cache._content))
+            await cleanup()
+        locks.cleanup = recording_cleanup
+
+        clock.run(self.handle(cache, locks))
+        self.assertEqual(cached_at_cleanup, [set(CHAIN)])
+
+    def test_failed_upload_stops_chain(self):
+        cache = SlowUploads(upload_time = .5, failing = [CHAIN[0]])
+
+        async def main():
+            await self.handle(cache, self.redis.locks())
+            locks = self.redis.locks()
+            return await locks.get_error(CHAIN[0]), await locks.jobs()
+
+        error, locked = clock.run(main())
+
+        self.assertEqual(error.http_status_code, 500)
+        self.assertEqual(locked, [])
+        # The failure is noticed while the second job is being touched
+        self.assertEqual([job for job in CHAIN if self.api.calls[job]], CHAIN[:2])
+        self.assertEqual(set(cache._content), {CHAIN[1]})
+
+    def test_only_cached_results_are_buffered(self):
+        cache = SlowUploads(upload_time = .5, failing = [CHAIN[0]])
+        results = result_buffer.ResultBuffer(max_bytes = 2**20, ttl = 600)
+
+        async def main():
+            await self.handle(cache, self.redis.locks(), results)
+            return await self.redis.locks().get_etag(CHAIN[1])
+
+        stored_etag = clock.run(main())
+        self.assertIsNone(results.get(CHAIN[0]))
+        content, etag = results.get(CHAIN[1])
+        self.assertEqual(etag, caching.content_etag(content))
+        self.assertEqual(etag, stored_etag)
+
+class TestTaskStats(TestCase):
+    def setUp(self):
+        self.redis = fakes.FakeRedis()
+        self.api = fakes.FakeApi(lambda: 2, random.Random(0), size = 100)
+        self.cache = fakes.FakeCache(lambda: 0)
+
+    def test_records_cached_jobs(self):
+        async def main():
+            await job_handler.JobHandler(self.api, self.cache, self.redis.locks()).handle_chain(CHAIN)
+            return await self.redis.locks().task_stats()
+
+        task_stats = clock.run(main())
+        self.assertEqual(set(task_stats), {stats.job_task_key(job) for job in CHAIN})
+        self.assertTrue(all(s.count == 1 and s.mean_size == 100 for s in task_stats.values()))
+        self.assertAlmostEqual(task_stats[stats.job_task_key(CHAIN[0])].mean_duration, 2)
+
+    def test_failing_stats_do_not_fail_jobs(self):
+        locks = self.redis.locks()
+        async def failing_record_task(*args):
+            raise ConnectionError("Redis went away")
+        locks.record_task = failing_record_task
+
+        async def main():
+            await job_handler.JobHandler(self.api, self.cache, locks).handle_chain(CHAIN)
+            return await self.redis.locks().errors()
+
+        self.assertEqual(clock.run(main()), {})
+        self.assertEqual(set(self.cache._content), set(CHAIN))
+
+class UnavailableCache(fakes.FakeCache):
+    """
+    A cache that fails to answer existence checks while down
+    """
+    def __init__(self):
+        super().__init__(lambda: 0)
+        self.down = False
+
+    async def exists(self, key: str)-> bool:
+        if self.down:
+            raise caching.CacheUnavailable("Circuit open")
+        return await super().exists(key)
+
+class TestCacheUnavailable(TestCase):
+    def setUp(self):
+        self.redis = fakes.FakeRedis()
+        self.api = fakes.FakeApi(lambda: 10, random.Random(0))
+        self.cache = UnavailableCache()
+
+    def handle(self, jobs):
+        return job_handler.JobHandler(self.api, self.cache, self.redis.locks(), retry_cooldown = 1).handle_chain(jobs)
+
+    def test_flags_chain_when_cache_is_down(self):
+        self.cache.down = True
+
+        async def main():
+            await self.handle(CHAIN)
+            locks = self.redis.locks()
+            return await locks.get_error(CHAIN[-1]), await locks.jobs()
+
+        error, locked = clock.run(main())
+        self.assertEqual(error.http_status_code, 503)
+        self.assertTrue(error.retryable)
+        self.assertEqual(locked, [])
+        self.assertEqual(sum(self.api.calls.values()), 0)
+
+    def test_keeps_waiting_through_outage(self):
+        async def main():
+            first = asyncio.create_task(self.handle(CHAIN[:2]))
+            await asyncio.sleep(1)
+            second = asyncio.create_task(self.handle(CHAIN))
+            await asyncio.sleep(1)
+
+            self.cache.down = True
+            await asyncio.sleep(10)
+            self.cache.down = False
+
+            await asyncio.gather(first, second)
+            return await self.redis.locks().errors()
+
+        self.assertEqual(clock.run(main()), {})
+        self.assertEqual(set(self.cache._content), set(CHAIN))
+        self.assertTrue(all(self.api.calls[job] == 1 for job in CHAIN))
+
+class TestAbandonment(TestCase):
+    def setUp(self):
+        self.redis = fakes.FakeRedis()
+        self.api = fakes.FakeApi(lambda: 10, random.Random(0))
+        self.cache = fakes.FakeCache(lambda: 0)
+
+    def handle(self, jobs, cancel_abandoned: bool):
+        handler = job_handler.JobHandler(self.api, self.cache, self.redis.locks(),
+                retry_cooldown = 1, check_errors_every = 5, cancel_abandoned = cancel_abandoned)
+        return handler.handle_chain(jobs)
+
+    def test_waiting_chain_without_interest_is_cancelled(self):
+        async def main():
+            computing = asyncio.create_task(self.handle(CHAIN[:2], cancel_abandoned = True))
+            await asyncio.sleep(1)
+            waiting = asyncio.create_task(self.handle(CHAIN, cancel_abandoned = True))
+            await asyncio.sleep(10)
+
+            cancelled_at = waiting.done() and asyncio.get_running_loop().time()
+            locked = await self.redis.locks().jobs()
+            await computing
+            return cancelled_at, locked
+
+        cancelled_at, locked = clock.run(main())
+        self.assertTrue(cancelled_at)
+        self.assertEqual(sorted(locked), sorted(CHAIN[:2]))
+        self.assertEqual([job for job in CHAIN if self.api.calls[job]], CHAIN[:2])
+
+    def test_waiting_chain_with_interest_keeps_waiting(self):
+        async def main():
+            await self.redis.locks().register_interest(CHAIN[-1], 600)
+            computing = asyncio.create_task(self.handle(CHAIN[:2], cancel_abandoned = True))
+            await asyncio.sleep(1)
+            await asyncio.gather(computing, self.handle(CHAIN, cancel_abandoned = True))
+
+        clock.run(main())
+        self.assertEqual(set(self.cache._content), set(CHAIN))
+        self.assertTrue(all(self.api.calls[job] == 1 for job in CHAIN))
+
+    def test_computing_chain_is_never_cancelled(self):
+        clock.run(self.handle(CHAIN, cancel_abandoned = True))
+        self.assertEqual(set(self.cache._content), set(CHAIN))
@@ -0,0 +1,114 @@
+
+import random
+import asyncio
+from unittest import TestCase
+from job_manager import job_handler, lifecycle, parse
+from job_manager.simulation import clock, fakes
+
+CHAIN = parse.subjobs("f/b/b/b/c/c/c")
+LONGER_CHAIN = parse.subjobs("f/a/a/a/b/b/b/c/c/c")
+
+class TestLifecycle(TestCase):
+    def setUp(self):
+        self.redis = fakes.FakeRedis()
+        self.api = fakes.FakeApi(lambda: 10, random.Random(0))
+        self.cache = fakes.FakeCache(lambda: 0)
+
+    def handle(self, owner: str, jobs):
+        handler = job_handler.JobHandler(self.api, self.cache, self.redis.locks(owner), retry_cooldown = 1)
+        return handler.handle_chain(jobs)
+
+    def test_handlers_journal_separately(self):
+        async def journal():
+            entries = await self.redis.locks("test").journaled_chains()
+            return sorted((e.jobs[-1], e.locked) for e in entries.values())
+
+        async def main():
+            handlers = [asyncio.create_task(self.handle("w", CHAIN))]
+            await asyncio.sleep(1)
+            handlers.append(asyncio.create_task(self.handle("w", CHAIN)))
+            handlers.append(asyncio.create_task(self.handle("w", LONGER_CHAIN)))
+            await asyncio.sleep(1)
+
+            during = await journal()
+            await asyncio.gather(*handlers)
+            return during, await journal()
+
+        during, after = clock.run(main())
+
+        # The second handler of CHAIN holds no locks, and leaves the entry of the first alone
+        self.assertEqual(during, sorted([
+            (CHAIN[-1], sorted(CHAIN)),
+            (LONGER_CHAIN[-1], [LONGER_CHAIN[-1]]),
+            ]))
+        self.assertEqual(after, [])
+        self.assertEqual(sum(self.api.calls.values()), len(LONGER_CHAIN))
+
+    def test_drain_waits_for_running_chains(self):
+        worker = lifecycle.Worker("w", drain_timeout = 60)
+
+        async def main():
+            await self.redis.locks("w").heartbeat(60)
+            worker.dispatch(self.handle("w", CHAIN))
+            await asyncio.sleep(1)
+            await worker.drain(lambda: self.redis.locks("w"))
+
+            locks = self.redis.locks("test")
+            return await locks.journaled_chains(), await locks.jobs(), await locks.live_workers()
+
+        journal, jobs, workers = clock.run(main())
+        self.assertEqual((journal, jobs, workers), ({}, [], set()))
+        self.assertTrue(all(job in self.cache._content for job in CHAIN))
+
+        self.assertRaises(lifecycle.Draining, worker.dispatch, asyncio.sleep(0))
+
+    def test_drain_hands_off_and_another_worker_resumes(self):
+        draining = lifecycle.Worker("w", drain_timeout = 5)
+        other = lifecycle.Worker("other", drain_timeout = 60)
+
+        async def main():
+            await self.redis.locks("other").heartbeat(600)
+            draining.dispatch(self.handle("w", CHAIN))
+            await asyncio.sleep(1)
+            await draining.drain(lambda: self.redis.locks("w"))
+
+            locks = self.redis.locks("test")
+            handed_off = list((await locks.journaled_chains()).values())
+            locked = await locks.jobs()
+
+            await other.recover(lambda: self.redis.locks("other"), lambda jobs: self.handle("other", jobs))
+            await other.drain(lambda: self.redis.locks("other"))
+            return handed_off, locked, await locks.journaled_chains()
+
+        handed_off, locked, journal = clock.run(main())
+
+        self.assertEqual([(e.owner, e.jobs, e.locked) for e in handed_off], [("w", CHAIN, [])])
+        self.assertEqual(locked, [])
+        self.assertEqual(journal, {})
+        self.assertTrue(all(job in self.cache._content for job in CHAIN))
+
+    def test_recovers_orphaned_chains_only(self):
+        worker = lifecycle.Worker("w", drain_timeout = 60)
+
+        async def main():
+            dead = self.redis.locks("dead")
+            for job in CHAIN:
+                await dead.lock(job)
+            await dead.journal_chain(CHAIN)
+
+            alive = self.redis.locks("alive")
+            await alive.heartbeat(600)
+            await alive.lock(LONGER_CHAIN[-1])
+            await alive.journal_chain(LONGER_CHAIN)
+
+            await worker.recover(lambda: self.redis.locks("w"), lambda jobs: self.handle("w", jobs))
+            await worker.drain(lambda: self.redis.locks("w"))
+
+            locks = self.redis.locks("test")
+            return list((await locks.journaled_chains()).values()), await locks.jobs()
+
+        journal, locked = clock.run(main())
+
+        self.assertEqual([(e.owner, e.jobs) for e in journal], [("alive", LONGER_CHAIN)])
+        self.assertEqual(locked, [LONGER_CHAIN[-1]])
+        self.assertEqual({job: self.api.calls[job] for job in CHAIN}, {job: 1 for job in CHAIN})
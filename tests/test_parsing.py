@@ -37,3 +37,8 @@ class TestParsing(TestCase):
         self.assertListEqual(
                 jobs,
                 ["foo/x/y/z","foo/1/2/2/x/y/z", "foo/a/b/c/1/2/2/x/y/z"])
+
+    def test_chain_tag(self):
+        base = "foo/a/b/c/1/2/2/x/y/z"
+        tags = {parse.chain_tag(job) for job in parse.subjobs(base)}
+        self.assertSetEqual(tags, {"foo/x/y/z"})
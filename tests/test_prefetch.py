@@ -0,0 +1,109 @@
+
+import os
+import json
+import time
+import random
+import asyncio
+import tempfile
+from unittest import TestCase
+from job_manager import job_handler, lifecycle, parse, prefetch
+from job_manager.simulation import fakes
+
+CHAIN = "f/a/a/a/b/b/b"
+OTHER_CHAIN = "g/c/c/c"
+JOBS = parse.subjobs(CHAIN)
+
+class TestWarmer(TestCase):
+    """
+    Runs on the real clock, with short intervals: learning reads the access
+    log from another thread, which the simulation clock cannot wait for.
+    """
+    def setUp(self):
+        folder = tempfile.TemporaryDirectory()
+        self.addCleanup(folder.cleanup)
+        self.log_path = os.path.join(folder.name, "access.jsonl")
+        with open(self.log_path, "w") as f:
+            for path in [CHAIN] * 4 + [OTHER_CHAIN] * 3:
+                f.write(json.dumps({"ts": time.time(), "path": path}) + "\n")
+
+        self.redis = fakes.FakeRedis()
+        self.api = fakes.FakeApi(lambda: .05, random.Random(0))
+        self.cache = fakes.FakeCache(lambda: 0)
+        self.worker = lifecycle.Worker("w")
+
+    def warm(self, jobs):
+        handler = job_handler.JobHandler(self.api, self.cache, self.redis.locks("w"), retry_cooldown = .05)
+        return handler.handle_chain(jobs)
+
+    def warmer(self):
+        return prefetch.Warmer(self.worker, self.log_path, self.warm, lambda: self.cache,
+                idle_after = .3, interval = .05)
+
+    async def keep_requesting(self, warmer: prefetch.Warmer, seconds: float):
+        for _ in range(int(seconds / .1)):
+            warmer.notice_request("h/x/x/x")
+            await asyncio.sleep(.1)
+
+    def test_warms_when_idle(self):
+        async def main():
+            warmer = self.warmer()
+            warmer.start()
+            try:
+                await self.keep_requesting(warmer, .6)
+                busy = sum(self.api.calls.values())
+
+                await asyncio.sleep(1.5)
+                return busy, await self.cache.exists(JOBS[-1]), await self.cache.exists(OTHER_CHAIN)
+            finally:
+                warmer.stop()
+
+        busy, warmed, warmed_other = asyncio.run(main())
+
+        self.assertEqual(busy, 0)
+        self.assertTrue(warmed)
+        self.assertTrue(warmed_other)
+        self.assertEqual(max(self.api.calls.values()), 1)
+
+    def test_warm_chain_not_interrupted_by_requests(self):
+        async def main():
+            warmer = self.warmer()
+            warmer.start()
+            try:
+                while not self.api.calls:
+                    await asyncio.sleep(.01)
+                await self.keep_requesting(warmer, 1)
+                return await self.cache.exists(JOBS[-1]), await self.cache.exists(OTHER_CHAIN)
+            finally:
+                warmer.stop()
+
+        warmed, warmed_other = asyncio.run(main())
+
+        # The chain being warmed runs to completion, but nothing more is warmed
+        self.assertTrue(warmed)
+        self.assertFalse(warmed_other)
+        self.assertEqual(set(self.api.calls), set(JOBS))
+
+    def test_respects_existing_locks(self):
+        async def main():
+            other = self.redis.locks("other")
+            await other.lock(JOBS[0])
+
+            warmer = self.warmer()
+            warmer.start()
+            try:
+                await asyncio.sleep(1)
+                waiting = dict(self.api.calls)
+
+                await self.cache.set(JOBS[0], b"computed elsewhere")
+                await other.unlock(JOBS[0])
+                await asyncio.sleep(1)
+                return waiting, await self.cache.exists(JOBS[-1])
+            finally:
+                warmer.stop()
+
+        waiting, warmed = asyncio.run(main())
+
+        self.assertNotIn(JOBS[0], waiting)
+        self.assertNotIn(JOBS[1], waiting)
+        self.assertTrue(warmed)
+        self.assertNotIn(JOBS[0], self.api.calls)
@@ -0,0 +1,127 @@
+
+import os
+import uuid
+import random
+import asyncio
+from unittest import TestCase, skipUnless
+import redis
+from job_manager import job_handler, parse, redis_locks, stats
+from job_manager.simulation import clock, fakes
+
+CHAIN = parse.subjobs("f/a/a/a/b/b/b")
+
+class TestErrors(TestCase):
+    def setUp(self):
+        self.redis = fakes.FakeRedis()
+
+    def test_retries_are_counted_across_requests(self):
+        async def main():
+            await self.redis.locks().set_error(CHAIN[0], 503, "timed out")
+            return [await self.redis.locks().retry_error(CHAIN[0], 3, 1) for _ in range(5)]
+
+        outcomes = clock.run(main())
+        self.assertEqual(outcomes[:3], [None, None, None])
+        self.assertEqual([o.retries for o in outcomes[3:]], [3, 3])
+
+    def test_retries_are_counted_across_failures(self):
+        async def main():
+            outcomes = []
+            for _ in range(4):
+                await self.redis.locks().set_error(CHAIN[0], 503, "timed out")
+                outcomes.append(await self.redis.locks().retry_error(CHAIN[0], 3, 1))
+            return outcomes
+
+        outcomes = clock.run(main())
+        self.assertEqual(outcomes[:3], [None, None, None])
+        self.assertEqual(outcomes[3].retries, 3)
+
+    def test_errors_that_are_not_retryable(self):
+        async def main():
+            await self.redis.locks().set_error(CHAIN[0], 500, "failed")
+            return await self.redis.locks().retry_error(CHAIN[0], 3, 1)
+
+        self.assertEqual(clock.run(main()).retries, 0)
+
+    def test_retries_do_not_extend_error(self):
+        locks = self.redis.locks()
+
+        async def main():
+            await locks.set_error(CHAIN[0], 503, "timed out")
+            await asyncio.sleep(100)
+
+            outcomes = [await locks.retry_error(CHAIN[0], 2, 0) for _ in range(3)]
+            await asyncio.sleep(301)
+            return outcomes, await locks.get_error(CHAIN[0])
+
+        outcomes, expired = clock.run(main())
+        self.assertEqual(outcomes[:2], [None, None])
+        self.assertEqual(outcomes[2].retries, 2)
+        self.assertIsNone(expired)
+
+    def test_errors_cleared_on_success(self):
+        api = fakes.FakeApi(lambda: 1, random.Random(0))
+        cache = fakes.FakeCache(lambda: 0)
+
+        async def main():
+            locks = self.redis.locks()
+            await cache.set(CHAIN[0], b"a")
+            for job in CHAIN:
+                await locks.set_error(job, 503, "timed out")
+
+            await job_handler.JobHandler(api, cache, self.redis.locks()).handle_chain(CHAIN)
+            return await locks.errors()
+
+        self.assertEqual(clock.run(main()), {})
+
+class TestInterest(TestCase):
+    def test_interest_expires_unless_refreshed(self):
+        redis = fakes.FakeRedis()
+
+        async def main():
+            locks = redis.locks()
+            await locks.register_interest(CHAIN[-1], 10)
+            await asyncio.sleep(5)
+            seen = [await locks.has_interest(CHAIN[-1])]
+
+            await locks.register_interest(CHAIN[-1], 10)
+            await asyncio.sleep(9)
+            seen.append(await locks.has_interest(CHAIN[-1]))
+
+            await asyncio.sleep(2)
+            seen.append(await locks.has_interest(CHAIN[-1]))
+            seen.append(await locks.has_interest(CHAIN[0]))
+            return seen
+
+        self.assertEqual(clock.run(main()), [True, True, False, False])
+
+@skipUnless(os.environ.get("TEST_REDIS_HOST"), "Set TEST_REDIS_HOST to run against a Redis server")
+class TestRecordTaskScript(TestCase):
+    """
+    Runs the task statistics script on a real Redis server, and checks it
+    against the Python equivalent that FakeRedis runs in its place.
+    """
+    def setUp(self):
+        self.host = os.environ["TEST_REDIS_HOST"]
+        self.port = int(os.environ.get("TEST_REDIS_PORT", 6379))
+        self.stats_key = f"jobman/test-stats:{uuid.uuid4().hex}"
+
+    def tearDown(self):
+        redis.Redis(self.host, self.port).delete(self.stats_key)
+
+    def test_script_matches_fake(self):
+        observations = [(2, 100), (4.5, 300), (3, 250), (.25, 10)]
+
+        async def record(locks: redis_locks.RedisLocks):
+            for duration, size in observations:
+                await locks.record_task(CHAIN[0], duration, size)
+            task_stats = await locks.task_stats()
+            await locks.close()
+            return task_stats[stats.job_task_key(CHAIN[0])]
+
+        expected = clock.run(record(fakes.FakeRedis().locks()))
+        recorded = asyncio.run(record(redis_locks.RedisLocks(self.host, self.port, 0, stats_key = self.stats_key)))
+
+        self.assertEqual(recorded.count, expected.count)
+        self.assertAlmostEqual(recorded.mean_duration, expected.mean_duration)
+        self.assertAlmostEqual(recorded.var_duration, expected.var_duration)
+        self.assertAlmostEqual(recorded.mean_size, expected.mean_size)
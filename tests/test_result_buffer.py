@@ -0,0 +1,26 @@
+
+import time
+from unittest import TestCase
+from job_manager.result_buffer import ResultBuffer
+
+class TestResultBuffer(TestCase):
+    def test_size_bound(self):
+        buffer = ResultBuffer(max_bytes = 10, ttl = 60)
+        buffer.put("a", b"aaaa", "1")
+        buffer.put("b", b"bbbb", "2")
+        self.assertEqual(buffer.get("a"), (b"aaaa", "1"))
+
+        buffer.put("c", b"cccc", "3")
+        self.assertIsNone(buffer.get("a"))
+        self.assertEqual(buffer.size, 8)
+
+        buffer.put("d", b"d" * 11, "4")
+        self.assertIsNone(buffer.get("d"))
+        self.assertEqual(len(buffer), 2)
+
+    def test_ttl(self):
+        buffer = ResultBuffer(max_bytes = 10, ttl = .01)
+        buffer.put("a", b"aaaa", "1")
+        time.sleep(.02)
+        self.assertIsNone(buffer.get("a"))
+        self.assertEqual(buffer.size, 0)
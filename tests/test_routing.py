@@ -0,0 +1,106 @@
+
+import asyncio
+from unittest import TestCase
+from aiohttp import web
+from aiohttp.test_utils import TestServer
+from job_manager import routing
+from job_manager.simulation import clock, fakes
+
+NODE = "http://a"
+OTHER = "http://b"
+
+class TestMembership(TestCase):
+    def setUp(self):
+        self.redis = fakes.FakeRedis()
+
+    def test_joins_announced_nodes(self):
+        async def main():
+            await self.redis.locks().announce_node(OTHER, 600)
+            membership = routing.Membership(NODE, refresh_interval = 5)
+            before = membership.nodes
+
+            membership.start(self.redis.locks)
+            await asyncio.sleep(1)
+            joined = membership.nodes
+
+            await membership.leave(self.redis.locks)
+            return before, joined, await self.redis.locks().live_nodes()
+
+        before, joined, remaining = clock.run(main())
+
+        self.assertEqual(before, {NODE})
+        self.assertEqual(joined, {NODE, OTHER})
+        self.assertEqual(remaining, {OTHER})
+
+    def test_dead_nodes_left_out_until_heartbeat_could_expire(self):
+        async def main():
+            await self.redis.locks().announce_node(OTHER, 600)
+            membership = routing.Membership(NODE, refresh_interval = 5)
+            membership.start(self.redis.locks)
+            await asyncio.sleep(1)
+
+            membership.mark_dead(OTHER)
+            membership.mark_dead(NODE)
+            dead = membership.nodes, membership.owner("key")
+
+            await asyncio.sleep(10)
+            suspected = membership.nodes
+            await asyncio.sleep(10)
+            recovered = membership.nodes
+
+            await membership.leave(self.redis.locks)
+            return dead, suspected, recovered
+
+        (dead, owner), suspected, recovered = clock.run(main())
+
+        self.assertEqual(dead, {NODE})
+        self.assertEqual(owner, NODE)
+        self.assertEqual(suspected, {NODE})
+        self.assertEqual(recovered, {NODE, OTHER})
+
+class TestForward(TestCase):
+    async def serve(self, handler, request):
+        app = web.Application()
+        app.router.add_get("/job/{path:.*}", handler)
+        server = TestServer(app)
+        await server.start_server()
+        try:
+            return await request(str(server.make_url("")).rstrip("/"))
+        finally:
+            await server.close()
+
+    def test_relays_response(self):
+        received = []
+        async def handler(request):
+            received.append((request.match_info["path"], dict(request.headers), dict(request.query)))
+            return web.Response(body = b"content", status = 206,
+                    headers = {"ETag": '"e"', "Content-Range": "bytes 0-6/10", "X-Other": "x"})
+
+        status, content, headers = asyncio.run(self.serve(handler,
+                lambda node: routing.forward(node, "f/a/a/a", {"Range": "bytes=0-6"}, 5, [("q", "1")])))
+
+        self.assertEqual((status, content), (206, b"content"))
+        self.assertEqual(headers["ETag"], '"e"')
+        self.assertEqual(headers["Content-Range"], "bytes 0-6/10")
+        self.assertNotIn("X-Other", headers)
+
+        [(path, request_headers, query)] = received
+        self.assertEqual(path, "f/a/a/a")
+        self.assertEqual(request_headers["Range"], "bytes=0-6")
+        self.assertIn(routing.FORWARDED_HEADER, request_headers)
+        self.assertEqual(query, {"q": "1"})
+
+    def test_truncated_response_is_unavailable(self):
+        async def handler(request):
+            response = web.StreamResponse(headers = {"Content-Length": "100"})
+            await response.prepare(request)
+            await response.write(b"partial")
+            request.transport.close()
+            return response
+
+        with self.assertRaises(routing.NodeUnavailable):
+            asyncio.run(self.serve(handler, lambda node: routing.forward(node, "f/a/a/a", {}, 5)))
+
+    def test_unreachable_is_unavailable(self):
+        with self.assertRaises(routing.NodeUnavailable):
+            asyncio.run(routing.forward("http://127.0.0.1:9", "f/a/a/a", {}, 5))
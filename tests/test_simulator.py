@@ -0,0 +1,32 @@
+
+import random
+from unittest import TestCase
+from job_manager import parse
+from job_manager.simulation import simulator, workload
+
+CHAINS = workload.example_chains()
+JOBS = {job for chain in CHAINS for job in parse.subjobs(chain)}
+
+def requests(n_requests: int = 50):
+    return workload.synthetic(CHAINS, n_requests, 2, random.Random(0))
+
+class TestSimulation(TestCase):
+    def test_requests_complete_without_duplicate_work(self):
+        report = simulator.Simulation(simulator.Config()).run(requests())
+
+        self.assertEqual((report["completed"], report["failed"], report["gave_up"]), (50, 0, 0))
+        self.assertEqual(report["upstream_calls"], len(JOBS))
+        self.assertEqual(report["upstream_duplicates"], 0)
+        self.assertGreater(report["latency"]["max"], report["latency"]["p50"])
+
+    def test_failures_are_reported(self):
+        report = simulator.Simulation(simulator.Config(failure_rate = 1)).run(requests())
+
+        self.assertEqual((report["completed"], report["failed"]), (0, 50))
+
+    def test_timeouts_are_retried_until_the_limit(self):
+        config = simulator.Config(timeout_rate = 1, max_timeout_retries = 3, timeout_cooldown = 1)
+        report = simulator.Simulation(config).run(requests(5))
+
+        self.assertEqual((report["completed"], report["failed"], report["gave_up"]), (0, 5, 0))
+        self.assertLess(report["virtual_time"]["clients"], config.client_timeout)
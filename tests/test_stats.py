@@ -0,0 +1,24 @@
+
+from unittest import TestCase
+from job_manager import stats
+
+class TestStats(TestCase):
+    def test_update(self):
+        task_stats = stats.TaskStats()
+        for duration in [10, 10, 10]:
+            task_stats = task_stats.update(duration, 100)
+        self.assertEqual(task_stats.count, 3)
+        self.assertAlmostEqual(task_stats.mean_duration, 10)
+        self.assertAlmostEqual(task_stats.var_duration, 0)
+        self.assertAlmostEqual(task_stats.mean_size, 100)
+
+        task_stats = task_stats.update(20, 200, alpha = .5)
+        self.assertAlmostEqual(task_stats.mean_duration, 15)
+        self.assertAlmostEqual(task_stats.mean_size, 150)
+        self.assertGreater(task_stats.p90_duration, task_stats.mean_duration)
+
+    def test_eta(self):
+        remaining = ["foo/1/2/3/x/y/z", "foo/a/b/c/1/2/3/x/y/z"]
+        task_stats = {"1/2": stats.TaskStats(1, 4, 0, 0)}
+        self.assertEqual(stats.job_task_key(remaining[1]), "a/b")
+        self.assertAlmostEqual(stats.eta(remaining, task_stats, 5), 9)
@@ -0,0 +1,30 @@
+
+import time
+import asyncio
+from unittest import TestCase
+from job_manager.simulation import clock
+
+class TestVirtualClock(TestCase):
+    def test_sleeps_take_virtual_time(self):
+        async def sleeper(seconds):
+            await asyncio.sleep(seconds)
+            return asyncio.get_running_loop().time()
+
+        async def main():
+            return await asyncio.gather(sleeper(3600), sleeper(60), sleeper(.5))
+
+        started = time.time()
+        self.assertEqual(clock.run(main()), [3600, 60, .5])
+        self.assertLess(time.time() - started, 1)
+
+    def test_timeouts(self):
+        async def main():
+            await asyncio.wait_for(asyncio.sleep(100), 10)
+
+        self.assertRaises(asyncio.TimeoutError, clock.run, main())
+
+    def test_deadlock(self):
+        async def main():
+            await asyncio.get_running_loop().create_future()
+
+        self.assertRaises(clock.Deadlock, clock.run, main())